@@ -0,0 +1,327 @@
+"""
+Benchmarks for the code paths that make Brave Manager slow. Everything runs
+against temporary directories and local servers, so the results don't depend
+on GitHub or on the user's cache.
+
+Usage, in the macos directory:
+    python -m benchmarks.run [--output results.json] [--runs 3] [name ...]
+
+The results are printed as JSON. For each benchmark, they contain the fastest
+and median time in seconds over several runs. Some benchmarks add further
+metrics, such as the download speed. Store the results of different commits
+to compare them.
+"""
+
+from argparse import ArgumentParser
+from contextlib import ExitStack
+from hashlib import md5
+from impl import cache, config, releases
+from impl.download import FileDownloader
+from impl.releases import HistoricReleases, get_releases, \
+    group_by_minor_version
+from os import makedirs
+from os.path import join
+from statistics import median
+from subprocess import run, DEVNULL
+from tempfile import TemporaryDirectory
+from tests.http_server import Handler, start_server, stop_server
+from time import perf_counter
+from unittest.mock import patch
+
+import json
+import platform
+import sys
+
+BENCHMARKS = {}
+
+def main():
+    args = parse_args()
+    names = args.names or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        print(f'Unknown benchmark(s): {", ".join(sorted(unknown))}')
+        sys.exit(1)
+    results = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': {}
+    }
+    for name in names:
+        print(f'Running {name}...', file=sys.stderr)
+        results['benchmarks'][name] = run_benchmark(BENCHMARKS[name], args.runs)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+def parse_args():
+    parser = ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument(
+        'names', nargs='*', metavar='name',
+        help=f'The benchmarks to run. Default: all of {", ".join(BENCHMARKS)}'
+    )
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output', help='Write the results to this file')
+    return parser.parse_args()
+
+def run_benchmark(benchmark, num_runs):
+    # Each run gets its own temporary directory and set-up, which is not
+    # timed.
+    times = []
+    metrics = {}
+    for _ in range(num_runs):
+        with TemporaryDirectory() as tmp_dir, ExitStack() as stack:
+            fn = benchmark(tmp_dir, stack)
+            start = perf_counter()
+            metrics = fn() or {}
+            times.append(perf_counter() - start)
+    result = {'runs': num_runs, 'min': min(times), 'median': median(times)}
+    # Metrics such as sizes are the same in each run. Rates are computed from
+    # the fastest run.
+    for key, value in metrics.items():
+        if key.endswith('_per_second'):
+            value /= min(times)
+        result[key] = value
+    return result
+
+def benchmark(fn):
+    # A benchmark is a function that takes a temporary directory and an
+    # ExitStack for cleaning up. It sets things up and returns the function to
+    # time. That function can return a dict of metrics. Those whose names end
+    # with _per_second are divided by the time it took.
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+@benchmark
+def releases_cold(tmp_dir, stack):
+    # The first run of `bm`: Import the historic releases of a channel and
+    # fetch the 1000 newest releases from GitHub.
+    _use_cache_dir(tmp_dir, stack)
+    _use_fake_github(stack)
+    return lambda: releases._cache_releases('nightly').close()
+
+@benchmark
+def releases_warm(tmp_dir, stack):
+    # `bm` runs again within 15 minutes. Nothing needs to be fetched.
+    _use_cache_dir(tmp_dir, stack)
+    _use_fake_github(stack)
+    releases._cache_releases('nightly').close()
+    return lambda: releases._cache_releases('nightly').close()
+
+@benchmark
+def releases_revalidate(tmp_dir, stack):
+    # `bm` runs again after 15 minutes. GitHub confirms via "304 Not
+    # Modified" that there are no new releases.
+    _use_cache_dir(tmp_dir, stack)
+    _use_fake_github(stack)
+    releases._cache_releases('nightly').close()
+    stack.enter_context(patch.object(releases, '_REFRESH_INTERVAL', -1))
+    return lambda: releases._cache_releases('nightly').close()
+
+@benchmark
+def get_releases_10x(tmp_dir, stack):
+    # Listing the versions of a channel whose history is ten times as long
+    # as today's. The releases are imported into the cache first.
+    _use_cache_dir(tmp_dir, stack)
+    stack.enter_context(
+        patch.object(releases, 'HISTORIC_RELEASES', _scale_up(10))
+    )
+    stack.enter_context(
+        patch.object(releases, '_needs_refresh', return_value=False)
+    )
+    get_releases('nightly', False)
+    def fn():
+        result = group_by_minor_version(get_releases('nightly', False))
+        return {'num_minor_versions': len(result)}
+    return fn
+
+@benchmark
+def import_releases_10x(tmp_dir, stack):
+    # The same, but including the import into the cache, which happens when
+    # historic-releases.zip changes.
+    _use_cache_dir(tmp_dir, stack)
+    stack.enter_context(
+        patch.object(releases, 'HISTORIC_RELEASES', _scale_up(10))
+    )
+    stack.enter_context(
+        patch.object(releases, '_needs_refresh', return_value=False)
+    )
+    return lambda: {'num_releases': len(get_releases('nightly', False))}
+
+@benchmark
+def historic_releases_read(tmp_dir, stack):
+    historic_releases = HistoricReleases(releases.HISTORIC_RELEASES)
+    return lambda: {'num_releases': len(historic_releases.read_all())}
+
+@benchmark
+def historic_releases_read_channel(tmp_dir, stack):
+    historic_releases = HistoricReleases(releases.HISTORIC_RELEASES)
+    return lambda: {
+        'num_releases': len(historic_releases.read_channel('nightly'))
+    }
+
+@benchmark
+def historic_releases_write(tmp_dir, stack):
+    all_releases = HistoricReleases(releases.HISTORIC_RELEASES).read_all()
+    historic_releases = HistoricReleases(join(tmp_dir, 'historic.zip'))
+    return lambda: historic_releases.write(all_releases)
+
+@benchmark
+def cache_get_size_cold(tmp_dir, stack):
+    # The size index does not exist yet, so every file is stat'ed.
+    _use_cache_dir(tmp_dir, stack)
+    _create_synthetic_cache()
+    return lambda: {'size': cache.get_size()}
+
+@benchmark
+def cache_get_size_warm(tmp_dir, stack):
+    _use_cache_dir(tmp_dir, stack)
+    _create_synthetic_cache()
+    cache.get_size()
+    return lambda: {'size': cache.get_size()}
+
+@benchmark
+def download_1_connection(tmp_dir, stack):
+    return _benchmark_download(tmp_dir, stack, num_connections=1)
+
+@benchmark
+def download_4_connections(tmp_dir, stack):
+    return _benchmark_download(tmp_dir, stack, num_connections=4)
+
+def _benchmark_download(tmp_dir, stack, num_connections):
+    content = bytes(range(256)) * (256 * 1024)
+    server = start_server(_create_file_handler(content))
+    stack.callback(stop_server, server)
+    url = server.url + '/Brave-Browser.dmg'
+    path = join(tmp_dir, 'Brave-Browser.dmg')
+    def fn():
+        downloader = FileDownloader(url, path, num_connections)
+        downloader.start()
+        num_bytes = sum(downloader.run())
+        return {'bytes': num_bytes, 'bytes_per_second': num_bytes}
+    return fn
+
+def _use_cache_dir(tmp_dir, stack):
+    stack.enter_context(
+        patch.object(cache, 'CACHE_DIR', join(tmp_dir, '.cache'))
+    )
+
+def _create_synthetic_cache(num_versions=500, num_installers=4):
+    for i in range(num_versions):
+        dir_path = join(
+            cache.CACHE_DIR, 'github.com', 'brave', 'brave-browser',
+            'releases', 'download', f'v1.{i // 10}.{i % 10}'
+        )
+        makedirs(dir_path)
+        for j in range(num_installers):
+            with open(join(dir_path, f'Brave-Browser-{j}.dmg'), 'wb') as f:
+                f.write(b'x' * (i + j))
+
+def _scale_up(factor):
+    # Returns the path of a copy of historic-releases.zip with `factor` times
+    # as many releases. It is only created once, because that takes long.
+    if factor not in _scaled_up_dirs:
+        historic_releases = \
+            HistoricReleases(releases.HISTORIC_RELEASES).read_all()
+        scaled_up = {}
+        for i in range(factor):
+            for cache_id, release in historic_releases.items():
+                scaled_up[f'{cache_id}-{i}'] = release
+        tmp_dir = TemporaryDirectory()
+        HistoricReleases(join(tmp_dir.name, 'historic.zip')).write(scaled_up)
+        _scaled_up_dirs[factor] = tmp_dir
+    return join(_scaled_up_dirs[factor].name, 'historic.zip')
+
+# Deleted when we exit.
+_scaled_up_dirs = {}
+
+def _use_fake_github(stack, num_pages=10):
+    pages = [
+        json.dumps([
+            _fake_github_release(1_000_000_000 - page * 100 - i)
+            for i in range(100)
+        ]).encode()
+        for page in range(num_pages)
+    ]
+    server = start_server(_create_github_handler(pages))
+    stack.callback(stop_server, server)
+    stack.enter_context(patch.object(config, 'GITHUB_API_URL', server.url))
+
+def _fake_github_release(release_id):
+    # A release like those in GitHub's API, with installers for all platforms.
+    version = f'1.{release_id % 100}.{release_id % 1000}'
+    url = f'https://github.com/brave/brave-browser/releases/download/v{version}'
+    asset_names = [
+        f'Brave-Browser-Nightly-{arch}.{ext}'
+        for arch in ('universal', 'arm64', 'x64')
+        for ext in ('dmg', 'pkg')
+    ] + [f'brave-browser-nightly-{version}-linux-{i}.zip' for i in range(20)]
+    return {
+        'id': release_id,
+        'url': f'https://api.github.com/repos/brave/brave-browser/releases/'
+               f'{release_id}',
+        'name': f'Nightly v{version} (Chromium 130.0.6723.58)',
+        'tag_name': f'v{version}',
+        'body': 'Release notes. ' * 100,
+        'prerelease': True,
+        'published_at': '2025-01-01T00:00:00Z',
+        'assets': [
+            {
+                'id': i,
+                'name': name,
+                'size': 150_000_000,
+                'download_count': 0,
+                'browser_download_url': f'{url}/{name}'
+            }
+            for i, name in enumerate(asset_names)
+        ]
+    }
+
+def _create_github_handler(pages):
+    etags = [f'"{md5(page).hexdigest()}"' for page in pages]
+    class GitHubHandler(Handler):
+        def do_GET(self):
+            page = int(self.path.rsplit('page=', 1)[1])
+            if page > len(pages):
+                body, etag = b'[]', '"empty"'
+            else:
+                body, etag = pages[page - 1], etags[page - 1]
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_body(200, body, {'ETag': etag})
+    return GitHubHandler
+
+def _create_file_handler(content):
+    class FileHandler(Handler):
+        def do_GET(self):
+            range_header = self.headers.get('Range')
+            if range_header:
+                start, end = range_header.split('=')[1].split('-')
+                start, end = int(start), int(end) + 1
+                self.send_response(206)
+            else:
+                start, end = 0, len(content)
+                self.send_response(200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start))
+            self.end_headers()
+            try:
+                self.wfile.write(memoryview(content)[start:end])
+            except ConnectionError:
+                pass
+    return FileHandler
+
+def get_commit():
+    cp = run(
+        ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+        stdin=DEVNULL
+    )
+    return cp.stdout.strip() or None
+
+if __name__ == '__main__':
+    main()
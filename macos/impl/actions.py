@@ -1,8 +1,33 @@
-from impl import brave, cache, updater
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from impl import brave, cache, config, mirrors, timing, updater
 from impl.sudo import sudo
-from impl.util import install_dmg, install_pkg, print_done, FileDownloader
-from os.path import exists, basename
-from tqdm import tqdm
+from impl.download import BandwidthLimit, FileDownloader, \
+    get_host_semaphore, get_shared_bandwidth_limit
+from impl.util import install_dmg, install_pkg, print_done, \
+    human_readable_size
+from os.path import basename, getsize
+from threading import Event, Lock
+
+def run_actions(actions, on_done=lambda action: None):
+    # Performs the actions in the given order. Actions can also have a
+    # preparation phase that does not depend on any other action, such as
+    # downloading an installer. These phases run in the background from the
+    # start. So eg. a download overlaps with uninstalling the old version and
+    # deleting the profile, instead of only starting once they are done.
+    to_prepare = [a for a in actions if hasattr(a, 'start_preparing')]
+    executor = ThreadPoolExecutor(max(len(to_prepare), 1))
+    try:
+        for action in to_prepare:
+            action.start_preparing(executor)
+        for action in actions:
+            action()
+            on_done(action)
+    finally:
+        for action in to_prepare:
+            action.cancel_preparation()
+        # Wait for the preparations to stop, so eg. partial downloads are
+        # saved for later.
+        executor.shutdown()
 
 class Uninstall:
     def __init__(self, channel):
@@ -21,18 +46,37 @@ class Install:
         self.channel = channel
         self.version = version
         self.installer_url = installer_url
+        self._progress = DownloadProgress(installer_url)
+        self._preparation = None
+        self._cancelled = Event()
     def __str__(self):
         return f'Install {basename(self.installer_url)} {self.version}'
+    def start_preparing(self, executor):
+        self._preparation = executor.submit(self._download)
+    def cancel_preparation(self):
+        self._cancelled.set()
     def __call__(self):
-        cache_path = cache.prepare(self.installer_url.split('//', 1)[1])
-        if not exists(cache_path):
-            download_file(self.installer_url, cache_path)
+        # Only show the progress of the download once we have to wait for it.
+        # Before, it would get in the way of the output of other actions.
+        self._progress.show()
+        if self._preparation is None:
+            cache_path = self._download()
+        else:
+            cache_path = self._preparation.result()
         installer_basename = basename(self.installer_url)
         with print_done(f'Installing {installer_basename}'):
             if installer_basename.endswith('.dmg'):
                 install_dmg(cache_path)
             elif installer_basename.endswith('.pkg'):
-                sudo(install_pkg, cache_path)
+                # install_pkg(...) runs in another process. So we time it
+                # here.
+                with timing.span('install_pkg', bytes=getsize(cache_path)):
+                    sudo(install_pkg, cache_path)
+    def _download(self):
+        cache_path, _ = download_to_cache(
+            self.installer_url, self._progress, self._cancelled
+        )
+        return cache_path
 
 class DeleteProfile:
     def __init__(self, channel):
@@ -68,11 +112,232 @@ class ClearCache:
     def __call__(self):
         cache.clear()
 
-def download_file(url, path):
-    print(f'Downloading {url}:')
-    downloader = FileDownloader(url, path)
-    total_size = downloader.start()
-    progress_bar = tqdm(total=total_size, unit='iB', unit_scale=True)
-    for num_bytes in downloader.run():
-        progress_bar.update(num_bytes)
-    progress_bar.close()
+class Prefetch:
+    def __init__(self, installer_urls, num_downloads=None, max_bandwidth=None):
+        self.installer_urls = installer_urls
+        self.num_downloads = num_downloads or config.PREFETCH_NUM_DOWNLOADS
+        if max_bandwidth is None:
+            max_bandwidth = config.PREFETCH_MAX_BANDWIDTH
+        self.max_bandwidth = max_bandwidth
+        # Maps each URL to 'cached', 'downloaded' or an error message:
+        self.results = {}
+    def __str__(self):
+        return f'Download {len(self.installer_urls)} installer(s) into the ' \
+               f'cache'
+    def __call__(self):
+        # Within the overall limit, if there is one.
+        shared_limit = get_shared_bandwidth_limit()
+        if self.max_bandwidth:
+            bandwidth_limit = BandwidthLimit(self.max_bandwidth, shared_limit)
+        else:
+            bandwidth_limit = shared_limit
+        keep = [_get_path_in_cache(url) for url in self.installer_urls]
+        cancelled = Event()
+        executor = ThreadPoolExecutor(self.num_downloads)
+        try:
+            futures = {
+                executor.submit(
+                    download_to_cache, url, DownloadProgress(url), cancelled,
+                    bandwidth_limit, keep
+                ): url
+                for url in self.installer_urls
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    _, was_downloaded = future.result()
+                except Exception as e:
+                    self.results[url] = str(e) or type(e).__name__
+                    print(f'Could not download {url}: {self.results[url]}')
+                else:
+                    self.results[url] = \
+                        'downloaded' if was_downloaded else 'cached'
+                    print(f'{url} is {self.results[url]}.')
+        finally:
+            cancelled.set()
+            executor.shutdown(cancel_futures=True)
+        num_failed = sum(
+            result not in ('cached', 'downloaded')
+            for result in self.results.values()
+        )
+        if num_failed:
+            raise RuntimeError(f'Could not download {num_failed} installer(s).')
+
+class PruneCache:
+    def __init__(self, files_to_prune):
+        self.files_to_prune = files_to_prune
+    def __str__(self):
+        num_files = len(self.files_to_prune)
+        size = sum(size for _, size in self.files_to_prune)
+        return f'Delete the {num_files} least recently used installer(s) ' \
+               f'from the cache ({human_readable_size(size)})'
+    def __call__(self):
+        with print_done('Pruning the cache'):
+            cache.prune()
+
+def download_to_cache(
+    url, progress, cancelled=None, bandwidth_limit=None, keep=()
+):
+    # Makes sure that an intact copy of the installer at `url` is in the
+    # cache. Returns its path and whether it had to be downloaded. When the
+    # cache then is too large, then the least recently used installers other
+    # than this one and those in `keep` are evicted.
+    path_in_cache = _get_path_in_cache(url)
+    cache_path = cache.prepare(path_in_cache)
+    # Another process, such as `bm prefetch` via cron, may be downloading the
+    # same installer. Wait for it, and then use its download. verify(...)
+    # must only run under the lock, too. Otherwise, it could delete a
+    # download that was just completed but not yet added to the cache.
+    def on_wait():
+        progress.wait_for_other_process()
+        _check_cancelled(cancelled, url)
+    with cache.lock(path_in_cache, on_wait):
+        if cache.verify(path_in_cache):
+            progress.close()
+            return cache_path, False
+        _check_cancelled(cancelled, url)
+        downloader = download_file(
+            url, cache_path, progress, cancelled, bandwidth_limit
+        )
+        cache.add(
+            path_in_cache, url, getsize(cache_path), downloader.get_sha256()
+        )
+    cache.prune(keep=[path_in_cache, *keep])
+    return cache_path, True
+
+def download_file(
+    url, path, progress=None, cancelled=None, bandwidth_limit=None
+):
+    # Downloads from the fastest mirror that has the file, or from `url`. If
+    # a source fails, then the download continues from the next one. Raises
+    # DownloadCancelled when the Event `cancelled` is set. What was
+    # downloaded until then is kept, so the download can be resumed.
+    if progress is None:
+        progress = DownloadProgress(url)
+        progress.show()
+    if bandwidth_limit is None:
+        bandwidth_limit = get_shared_bandwidth_limit()
+    try:
+        sources = mirrors.get_sources(url)
+        for i, source in enumerate(sources):
+            try:
+                return _download_from(
+                    url, source, path, progress, cancelled, bandwidth_limit
+                )
+            except DownloadCancelled:
+                raise
+            except Exception:
+                if i == len(sources) - 1:
+                    raise
+    finally:
+        progress.close()
+
+def _download_from(
+    url, source, path, progress, cancelled, bandwidth_limit
+):
+    semaphore = get_host_semaphore(source)
+    # Wait for other downloads from the same host, unless we are cancelled.
+    while not semaphore.acquire(timeout=_CANCEL_CHECK_INTERVAL):
+        _check_cancelled(cancelled, source)
+    try:
+        downloader = FileDownloader(
+            url, path, bandwidth_limit=bandwidth_limit, source=source
+        )
+        progress.start(
+            downloader.start(), downloader.get_num_bytes_downloaded()
+        )
+        chunks = downloader.run()
+        try:
+            for num_bytes in chunks:
+                progress.update(num_bytes)
+                _check_cancelled(cancelled, source)
+        finally:
+            chunks.close()
+    finally:
+        semaphore.release()
+    return downloader
+
+def _check_cancelled(cancelled, url):
+    if cancelled is not None and cancelled.is_set():
+        raise DownloadCancelled(url)
+
+# How often to check whether a download that waits was cancelled, in seconds:
+_CANCEL_CHECK_INTERVAL = 0.1
+
+class DownloadCancelled(Exception):
+    pass
+
+class DownloadProgress:
+
+    # Counts the bytes of a download. A progress bar is only shown after
+    # show() was called. This lets a download run in the background without
+    # garbling the output of other actions.
+
+    def __init__(self, url):
+        self.url = url
+        self._lock = Lock()
+        self._total = None
+        self._num_bytes = 0
+        self._is_running = False
+        self._is_waiting = False
+        self._is_visible = False
+        self._progress_bar = None
+
+    def start(self, total, initial):
+        # Can be called again when the download continues from another
+        # source.
+        with self._lock:
+            self._total = total
+            self._num_bytes = initial
+            self._is_running = True
+            self._is_waiting = False
+            if self._progress_bar is not None:
+                self._progress_bar.close()
+                self._progress_bar = None
+            if self._is_visible:
+                self._show_progress_bar()
+
+    def update(self, num_bytes):
+        with self._lock:
+            self._num_bytes += num_bytes
+            if self._progress_bar is not None:
+                self._progress_bar.update(num_bytes)
+
+    def wait_for_other_process(self):
+        # Another process downloads the file. Can be called repeatedly.
+        with self._lock:
+            if self._is_waiting:
+                return
+            self._is_waiting = True
+            if self._is_visible:
+                self._print_waiting()
+
+    def show(self):
+        with self._lock:
+            self._is_visible = True
+            if self._is_running and self._progress_bar is None:
+                self._show_progress_bar()
+            elif self._is_waiting:
+                self._print_waiting()
+
+    def close(self):
+        with self._lock:
+            self._is_running = False
+            self._is_waiting = False
+            if self._progress_bar is not None:
+                self._progress_bar.close()
+
+    def _print_waiting(self):
+        print(f'Waiting for another process to download {self.url}...')
+
+    def _show_progress_bar(self):
+        # Imported here, so commands that don't download start faster.
+        from tqdm import tqdm
+        print(f'Downloading {self.url}:')
+        self._progress_bar = tqdm(
+            total=self._total, initial=self._num_bytes, unit='iB',
+            unit_scale=True
+        )
+
+def _get_path_in_cache(url):
+    return url.split('//', 1)[1]
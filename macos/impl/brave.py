@@ -1,8 +1,5 @@
-from impl import CHANNELS
-from os import remove
-from os.path import exists, isdir, join, expanduser
-from plistlib import load
-from shutil import rmtree
+from impl import timing, trash, CHANNELS
+from os.path import exists, join, expanduser
 from subprocess import run
 
 def get_installed_channels():
@@ -18,8 +15,10 @@ def get_installed_channels():
         result[channel] = version
     return result
 
+@timing.timed('brave.uninstall')
 def uninstall(channel):
-    rmtree(get_app_dir(channel))
+    trash_dir = trash.move_to_trash(get_app_dir(channel))
+    trash.empty_in_background([trash_dir])
 
 def launch(channel):
     run(['open', '-a', get_app_dir(channel)])
@@ -32,6 +31,7 @@ def get_app_dir(channel):
     return join('/Applications', f'Brave Browser{suffix}.app')
 
 def get_version(app_dir):
+    from plistlib import load
     info_plist_path = join(app_dir, 'Contents', 'Info.plist')
     with open(info_plist_path, 'rb') as f:
         plist = load(f)
@@ -47,12 +47,26 @@ def get_existing_profiles():
                 break
     return result
 
+@timing.timed('brave.delete_profile')
 def delete_profile(channel):
+    # Brave can create a fresh profile right away. The old one is deleted in
+    # the background.
+    trash_dirs = set()
     for path in get_profile_paths(channel):
-        if isdir(path):
-            rmtree(path)
-        elif exists(path):
-            remove(path)
+        try:
+            trash_dirs.add(trash.move_to_trash(path))
+        except FileNotFoundError:
+            pass
+    trash.empty_in_background(trash_dirs)
+
+def get_trash_dirs():
+    # The trash directories that uninstall(...) and delete_profile(...) use.
+    result = set()
+    for channel in CHANNELS:
+        result.add(trash.get_trash_dir(get_app_dir(channel)))
+        for path in get_profile_paths(channel):
+            result.add(trash.get_trash_dir(path))
+    return result
 
 def get_profile_paths(channel):
     if channel == 'release':
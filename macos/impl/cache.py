@@ -1,26 +1,328 @@
-from os import makedirs
-from os.path import dirname, join
-from os.path import getsize
+from contextlib import contextmanager
+from hashlib import sha256
+from impl import config
+from os import makedirs, remove, removedirs, replace, scandir, stat
+from os.path import basename, dirname, join, relpath, sep
+from os.path import getmtime, getsize
 from shutil import rmtree
+from tempfile import NamedTemporaryFile
+from time import sleep, time
 
+import fcntl
+import json
 import os
 
 CACHE_DIR = join(dirname(dirname(dirname(__file__))), '.cache')
 
+# Records the source URL, expected size, SHA-256 digest, download time and
+# time of last use of each installer in the cache. This lets us tell whether
+# an installer is complete and intact before we use it, and which installers
+# to evict first when the cache grows too large.
+_MANIFEST = 'manifest.json'
+
+# Computing the size of the cache via os.walk(...) gets slow as the cache grows
+# to hundreds of installers. So we remember the size of each file in the
+# subdirectories of CACHE_DIR, along with the modification time of each
+# subdirectory. Adding or removing a file changes the modification time of
+# its parent directory. So as long as no modification time changed, the index
+# is still accurate. We keep it up to date as we add and evict installers.
+_SIZE_INDEX = 'size-index.json'
+
+# The suffixes of the files that FileDownloader writes while it downloads,
+# and of the lock files of downloads. Those are never evicted, because another
+# process may hold the lock.
+_NOT_EVICTED = ('.part', '.part.json', '.lock')
+
+_LOCK_POLL_INTERVAL = 0.1
+
 def prepare(path_in_cache):
-    absolute_path = join(CACHE_DIR, path_in_cache)
+    absolute_path = _get_path(path_in_cache)
     makedirs(dirname(absolute_path), exist_ok=True)
+    if dirname(path_in_cache):
+        _update_size_index([path_in_cache])
     return absolute_path
 
+@contextmanager
+def lock(name, on_wait=None):
+    # Several Brave Manager processes can use the cache at the same time. This
+    # returns a context manager that makes the others wait while one of them
+    # works on the part of the cache with the given name. While we wait,
+    # on_wait() is called every _LOCK_POLL_INTERVAL seconds. It can raise an
+    # exception to stop waiting.
+    path_in_cache = name + '.lock'
+    with _lock_file(_get_path(path_in_cache), on_wait):
+        if dirname(name):
+            # Keep the size index current for the lock file we may have just
+            # created.
+            _update_size_index([path_in_cache])
+        yield
+
+def add(path_in_cache, url, size, sha256_hex):
+    with lock('manifest'):
+        manifest = _read_manifest()
+        manifest[path_in_cache] = {
+            'url': url,
+            'size': size,
+            'sha256': sha256_hex,
+            'timestamp': time(),
+            'last_used': time()
+        }
+        _write_manifest(manifest)
+    _update_size_index([path_in_cache])
+
+def verify(path_in_cache):
+    # Returns True if the file was added to the cache and has not changed
+    # since. Otherwise, evicts it from the cache, so it can be re-downloaded.
+    entry = _read_manifest().get(path_in_cache)
+    absolute_path = _get_path(path_in_cache)
+    is_intact = entry is not None and _is_intact(absolute_path, entry)
+    if not is_intact:
+        try:
+            remove(absolute_path)
+        except FileNotFoundError:
+            pass
+        _update_size_index([path_in_cache])
+    if entry is not None:
+        with lock('manifest'):
+            manifest = _read_manifest()
+            if is_intact:
+                manifest[path_in_cache]['last_used'] = time()
+            else:
+                manifest.pop(path_in_cache, None)
+            _write_manifest(manifest)
+    return is_intact
+
 def get_size():
     result = 0
-    for parent_dir, _, files in os.walk(CACHE_DIR):
-        for file_name in files:
-            result += getsize(join(parent_dir, file_name))
+    try:
+        with scandir(CACHE_DIR) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    result += entry.stat().st_size
+    except FileNotFoundError:
+        return 0
+    return result + sum(_get_sizes_of_files_in_subdirs().values())
+
+def get_files_to_prune(max_size=None, keep=()):
+    # Returns the installers that prune(...) would evict, as a list of
+    # (path_in_cache, size) pairs. Files directly in CACHE_DIR, such as
+    # releases.json, are never evicted. Neither are the files of downloads
+    # in progress, which may be running in another process, or which can be
+    # resumed later.
+    if max_size is None:
+        max_size = config.CACHE_MAX_SIZE
+    excess = get_size() - max_size
+    if excess <= 0:
+        return []
+    manifest = _read_manifest()
+    candidates = []
+    for path_in_cache, size in _get_sizes_of_files_in_subdirs().items():
+        if path_in_cache in keep or path_in_cache.endswith(_NOT_EVICTED):
+            continue
+        try:
+            last_used = manifest[path_in_cache]['last_used']
+        except KeyError:
+            last_used = getmtime(_get_path(path_in_cache))
+        candidates.append((last_used, path_in_cache, size))
+    result = []
+    for _, path_in_cache, size in sorted(candidates):
+        if excess <= 0:
+            break
+        result.append((path_in_cache, size))
+        excess -= size
     return result
 
+def prune(max_size=None, keep=()):
+    # Evicts the least recently used installers until the cache is no larger
+    # than `max_size` bytes. Returns the number of bytes freed.
+    to_prune = get_files_to_prune(max_size, keep)
+    if not to_prune:
+        return 0
+    for path_in_cache, _ in to_prune:
+        absolute_path = _get_path(path_in_cache)
+        try:
+            remove(absolute_path)
+        except FileNotFoundError:
+            pass
+        try:
+            removedirs(dirname(absolute_path))
+        except OSError:
+            # The directory is not empty.
+            pass
+    with lock('manifest'):
+        manifest = _read_manifest()
+        for path_in_cache, _ in to_prune:
+            manifest.pop(path_in_cache, None)
+        _write_manifest(manifest)
+    _update_size_index([path_in_cache for path_in_cache, _ in to_prune])
+    return sum(size for _, size in to_prune)
+
 def clear():
     try:
         rmtree(CACHE_DIR)
     except FileNotFoundError:
         pass
+
+def _get_path(path_in_cache):
+    # Not computed once at import time, so that eg. tests only need to change
+    # CACHE_DIR.
+    return join(CACHE_DIR, path_in_cache)
+
+def _is_intact(path, entry):
+    try:
+        if getsize(path) != entry['size']:
+            return False
+        with open(path, 'rb') as f:
+            digest = sha256()
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return False
+    return digest.hexdigest() == entry['sha256']
+
+def _get_sizes_of_files_in_subdirs():
+    with lock('size-index'):
+        index = _read_size_index()
+        if index is None or not _is_size_index_current(index):
+            index = _build_size_index()
+            _write_size_index(index)
+    return index['files']
+
+def _update_size_index(changed_paths_in_cache):
+    with lock('size-index'):
+        _update_size_index_locked(changed_paths_in_cache)
+
+def _update_size_index_locked(changed_paths_in_cache):
+    index = _read_size_index()
+    changed_dirs = set()
+    for path_in_cache in changed_paths_in_cache:
+        parts = path_in_cache.split(sep)[:-1]
+        for i in range(1, len(parts) + 1):
+            changed_dirs.add(sep.join(parts[:i]))
+    # If something else changed the cache, then we can't update the index
+    # incrementally. Leave it as it is, so it gets rebuilt when it is needed.
+    if index is None or not _is_size_index_current(index, changed_dirs):
+        return
+    # Rescan each changed directory as a whole. Other files in it may also
+    # have changed, eg. when FileDownloader renamed Brave.dmg.part to
+    # Brave.dmg.
+    for dir_in_cache in sorted(changed_dirs):
+        _rescan_dir(index, dir_in_cache)
+    _write_size_index(index)
+
+def _is_size_index_current(index, dirs_to_ignore=()):
+    try:
+        with scandir(CACHE_DIR) as entries:
+            top_level_dirs = {e.name for e in entries if e.is_dir()}
+    except FileNotFoundError:
+        top_level_dirs = set()
+    top_level_dirs_in_index = {d for d in index['dirs'] if sep not in d}
+    dirs_to_ignore = set(dirs_to_ignore)
+    if top_level_dirs - dirs_to_ignore != \
+            top_level_dirs_in_index - dirs_to_ignore:
+        return False
+    for dir_in_cache, mtime_ns in index['dirs'].items():
+        if dir_in_cache in dirs_to_ignore:
+            continue
+        try:
+            if stat(_get_path(dir_in_cache)).st_mtime_ns != mtime_ns:
+                return False
+        except FileNotFoundError:
+            return False
+    return True
+
+def _rescan_dir(index, dir_in_cache):
+    # Replaces the index's entries for the files directly in the directory.
+    files = index['files']
+    for path_in_cache in [p for p in files if dirname(p) == dir_in_cache]:
+        del files[path_in_cache]
+    absolute_path = _get_path(dir_in_cache)
+    try:
+        # Before the scan. So if the directory changes during it, then the
+        # index is rebuilt the next time it is needed.
+        index['dirs'][dir_in_cache] = stat(absolute_path).st_mtime_ns
+        with scandir(absolute_path) as entries:
+            file_entries = [e for e in entries if not e.is_dir()]
+    except FileNotFoundError:
+        # The directory was removed, along with everything in it.
+        prefix = dir_in_cache + sep
+        for path_in_cache in [p for p in files if p.startswith(prefix)]:
+            del files[path_in_cache]
+        for d in list(index['dirs']):
+            if d == dir_in_cache or d.startswith(prefix):
+                del index['dirs'][d]
+        return
+    for entry in file_entries:
+        try:
+            files[join(dir_in_cache, entry.name)] = entry.stat().st_size
+        except FileNotFoundError:
+            # Removed since the scan. This changed the directory's mtime.
+            pass
+
+def _build_size_index():
+    result = {'files': {}, 'dirs': {}}
+    for parent_dir, _, files in os.walk(CACHE_DIR):
+        if parent_dir == CACHE_DIR:
+            continue
+        dir_in_cache = relpath(parent_dir, CACHE_DIR)
+        result['dirs'][dir_in_cache] = stat(parent_dir).st_mtime_ns
+        for file_name in files:
+            path_in_cache = join(dir_in_cache, file_name)
+            file_path = join(parent_dir, file_name)
+            result['files'][path_in_cache] = getsize(file_path)
+    return result
+
+def _read_size_index():
+    try:
+        with open(_get_path(_SIZE_INDEX)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_size_index(index):
+    _write_json_atomically(_get_path(_SIZE_INDEX), index)
+
+def _read_manifest():
+    try:
+        with open(_get_path(_MANIFEST)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _write_manifest(manifest):
+    _write_json_atomically(_get_path(_MANIFEST), manifest)
+
+def _write_json_atomically(path, data):
+    # Readers, also in other processes, see either the old or the new file.
+    # Each writer uses its own temporary file, so they can't garble each other.
+    makedirs(dirname(path), exist_ok=True)
+    with NamedTemporaryFile(
+        'w', dir=dirname(path), prefix=basename(path) + '.',
+        suffix='.tmp', delete=False
+    ) as f:
+        try:
+            json.dump(data, f)
+        except BaseException:
+            f.close()
+            remove(f.name)
+            raise
+    replace(f.name, path)
+
+@contextmanager
+def _lock_file(path, on_wait=None):
+    makedirs(dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        if on_wait is None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    on_wait()
+                    sleep(_LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
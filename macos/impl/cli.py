@@ -0,0 +1,257 @@
+"""
+A non-interactive interface to Brave Manager, for use in scripts. Examples:
+
+    bm install --channel nightly --version 1.70.x --installer universal.dmg
+    bm install --channel beta --delete-profile --launch
+    bm uninstall --channel nightly --delete-profile
+    bm delete-profile --channel nightly
+    bm prune-cache
+    bm prefetch --channel nightly --channel beta --num-versions 2
+
+Progress is printed to stderr. The result is printed to stdout as a JSON
+object. The exit code is 0 on success and 1 on failure. Add --profile, eg.
+`bm --profile prune-cache`, to also print how long each phase took to stderr.
+"""
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from impl import brave, cache, config, CHANNELS
+from impl.actions import Uninstall, Install, Launch, DeleteProfile, \
+    Prefetch, PruneCache, run_actions
+from impl.releases import get_releases, group_by_minor_version
+
+import json
+import sys
+
+def main(argv):
+    args = _parse_args(argv)
+    result = {'command': args.command, 'actions': []}
+    try:
+        # Actions print their progress to stdout. Keep it free for the result.
+        with redirect_stdout(sys.stderr):
+            actions = _get_actions(args, result)
+            entries = {}
+            for action in actions:
+                entry = {'action': str(action), 'status': 'pending'}
+                result['actions'].append(entry)
+                entries[action] = entry
+            def on_done(action):
+                entries[action]['status'] = 'done'
+            try:
+                run_actions(actions, on_done)
+            finally:
+                for action in actions:
+                    if isinstance(action, Prefetch):
+                        result['prefetched'] = action.results
+    except Exception as e:
+        result['ok'] = False
+        result['error'] = str(e) or type(e).__name__
+        for entry in result['actions']:
+            if entry['status'] == 'pending':
+                entry['status'] = 'failed'
+                break
+    else:
+        result['ok'] = True
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0 if result['ok'] else 1
+
+class CliError(Exception):
+    pass
+
+def select_release(releases, version=None):
+    # `releases` are sorted newest first, as returned by get_releases(...).
+    # `version` can be None for the latest release, a minor version such as
+    # 1.70.x for the latest release in it, or an exact version.
+    if version is None:
+        if not releases:
+            raise CliError('There are no releases.')
+        return releases[0]
+    minor_releases = group_by_minor_version(releases)
+    if version in minor_releases:
+        return minor_releases[version][0]
+    for release in releases:
+        if release['version'] == version:
+            return release
+    raise CliError(f'There is no release {version}.')
+
+def select_installer(release, installer=None):
+    # Returns the name of the release's installer that `installer` refers to.
+    # This can be its full name, or a part of it such as "universal" or
+    # "arm64.dmg". When the choice is ambiguous, then DMGs are preferred.
+    # Without `installer`, the universal one is preferred, which runs on all
+    # Macs.
+    installers = release['installers']
+    if installer is None:
+        candidates = [name for name in installers if 'universal' in name] \
+            or list(installers)
+    elif installer in installers:
+        return installer
+    else:
+        candidates = [name for name in installers if installer in name]
+    if len(candidates) > 1:
+        candidates = [name for name in candidates if name.endswith('.dmg')] \
+            or candidates
+    if len(candidates) != 1:
+        names = ', '.join(installers)
+        raise CliError(
+            f'Please use --installer to pick one of the installers of '
+            f'{release["version"]}: {names}'
+        )
+    return candidates[0]
+
+def _get_actions(args, result):
+    if args.command == 'install':
+        return _get_install_actions(args, result)
+    elif args.command == 'uninstall':
+        if args.channel not in brave.get_installed_channels():
+            raise CliError(f'{args.channel.title()} is not installed.')
+        actions = [Uninstall(args.channel)]
+        if args.delete_profile \
+                and args.channel in brave.get_existing_profiles():
+            actions.append(DeleteProfile(args.channel))
+        return actions
+    elif args.command == 'delete-profile':
+        if args.channel not in brave.get_existing_profiles():
+            raise CliError(f'There is no {args.channel.title()} profile.')
+        return [DeleteProfile(args.channel)]
+    elif args.command == 'prune-cache':
+        files_to_prune = cache.get_files_to_prune()
+        result['pruned'] = [path for path, _ in files_to_prune]
+        return [PruneCache(files_to_prune)] if files_to_prune else []
+    elif args.command == 'prefetch':
+        return _get_prefetch_actions(args)
+    raise ValueError(args.command)
+
+def _get_install_actions(args, result):
+    public_only = not args.allow_prerelease
+    releases = get_releases(args.channel, public_only)
+    release = select_release(releases, args.version)
+    installer_name = select_installer(release, args.installer)
+    installer_url = release['installers'][installer_name]
+    result['release'] = {
+        'channel': args.channel,
+        'version': release['version'],
+        'name': release['name'],
+        'prerelease': release['prerelease'],
+        'installer': installer_name,
+        'url': installer_url
+    }
+    actions = []
+    if args.channel in brave.get_installed_channels():
+        actions.append(Uninstall(args.channel))
+    if args.delete_profile and args.channel in brave.get_existing_profiles():
+        actions.append(DeleteProfile(args.channel))
+    actions.append(Install(args.channel, release['version'], installer_url))
+    if args.launch:
+        actions.append(Launch(args.channel))
+    return actions
+
+def _get_prefetch_actions(args):
+    # Prefetches the installers that match --installer for the newest
+    # versions of each channel. Versions that don't have a matching installer
+    # are skipped.
+    public_only = not args.allow_prerelease
+    installer_urls = []
+    for channel in args.channel or CHANNELS:
+        releases = get_releases(channel, public_only)
+        for release in releases[:args.num_versions]:
+            for installer in args.installer or config.PREFETCH_INSTALLERS:
+                try:
+                    installer_name = select_installer(release, installer)
+                except CliError:
+                    continue
+                installer_url = release['installers'][installer_name]
+                if installer_url not in installer_urls:
+                    installer_urls.append(installer_url)
+    if not installer_urls:
+        raise CliError('There are no installers to prefetch.')
+    return [
+        Prefetch(installer_urls, args.num_downloads, args.max_bandwidth)
+    ]
+
+def _parse_args(argv):
+    parser = ArgumentParser(
+        prog='bm',
+        description='Run without arguments for interactive mode. Add '
+                    '--profile to print how long each phase took.'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    install = commands.add_parser(
+        'install', help='Install a version of Brave'
+    )
+    _add_channel_argument(install)
+    install.add_argument(
+        '--version',
+        help='An exact version such as 1.70.123, or the latest version in a '
+             'minor version such as 1.70.x. Default: the latest version'
+    )
+    install.add_argument(
+        '--installer',
+        help='The name of the installer, or a part of it such as arm64. '
+             'Default: the universal DMG'
+    )
+    install.add_argument(
+        '--allow-prerelease', action='store_true',
+        help='Also consider versions that are not public yet'
+    )
+    _add_delete_profile_argument(install)
+    install.add_argument(
+        '--launch', action='store_true', help='Launch Brave afterwards'
+    )
+
+    uninstall = commands.add_parser('uninstall', help='Uninstall Brave')
+    _add_channel_argument(uninstall)
+    _add_delete_profile_argument(uninstall)
+
+    delete_profile = commands.add_parser(
+        'delete-profile', help='Delete a profile'
+    )
+    _add_channel_argument(delete_profile)
+
+    commands.add_parser(
+        'prune-cache', help='Delete the least recently used installers'
+    )
+
+    prefetch = commands.add_parser(
+        'prefetch',
+        help='Download the installers of the newest versions into the cache'
+    )
+    prefetch.add_argument(
+        '--channel', choices=CHANNELS, action='append',
+        help='Can be given several times. Default: all channels'
+    )
+    prefetch.add_argument(
+        '--num-versions', type=int, default=config.PREFETCH_NUM_VERSIONS,
+        help='How many of the newest versions of each channel to prefetch'
+    )
+    prefetch.add_argument(
+        '--installer', action='append',
+        help='A part of the names of the installers to prefetch. Can be '
+             'given several times. Default: '
+             + ','.join(config.PREFETCH_INSTALLERS)
+    )
+    prefetch.add_argument(
+        '--allow-prerelease', action='store_true',
+        help='Also consider versions that are not public yet'
+    )
+    prefetch.add_argument(
+        '--num-downloads', type=int, default=config.PREFETCH_NUM_DOWNLOADS,
+        help='How many installers to download at the same time'
+    )
+    prefetch.add_argument(
+        '--max-bandwidth', type=int, default=config.PREFETCH_MAX_BANDWIDTH,
+        help='The maximum combined download speed in bytes per second. '
+             '0 means no limit'
+    )
+    return parser.parse_args(argv)
+
+def _add_channel_argument(parser):
+    parser.add_argument('--channel', choices=CHANNELS, required=True)
+
+def _add_delete_profile_argument(parser):
+    parser.add_argument(
+        '--delete-profile', action='store_true',
+        help='Also delete the profile of the channel'
+    )
@@ -0,0 +1,58 @@
+from os import getenv
+from os.path import expanduser
+
+# Brave Manager's settings. Each can be overridden with an environment variable
+# of the same name, prefixed with BM_. For example, tests can point us at a
+# local server via BM_GITHUB_API_URL.
+
+GITHUB_API_URL = getenv('BM_GITHUB_API_URL', 'https://api.github.com')
+
+# Seconds to wait for a connection, and for data on an established connection:
+CONNECT_TIMEOUT = float(getenv('BM_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT = float(getenv('BM_READ_TIMEOUT', 60))
+
+# How often to retry requests that fail with a server error or a dropped
+# connection. The wait between retries grows exponentially.
+NUM_RETRIES = int(getenv('BM_NUM_RETRIES', 3))
+
+# How many connections to download an installer with, in parallel.
+DOWNLOAD_CONNECTIONS = int(getenv('BM_DOWNLOAD_CONNECTIONS', 4))
+
+# Comma-separated base URLs of mirrors to download installers from before
+# falling back to GitHub, eg. http://cache.office.example:8000. See
+# impl/mirrors.py. Mirrors that don't respond within MIRROR_TIMEOUT seconds
+# are skipped. Asking GitHub for the size of an installer, which the mirrors'
+# copies must match, uses the usual timeouts and retries.
+DOWNLOAD_MIRRORS = [
+    mirror for mirror in getenv('BM_DOWNLOAD_MIRRORS', '').split(',') if mirror
+]
+MIRROR_TIMEOUT = float(getenv('BM_MIRROR_TIMEOUT', 2))
+
+# All downloads of a Brave Manager process together use at most this many
+# bytes per second. 0 means no limit.
+DOWNLOAD_MAX_BANDWIDTH = int(getenv('BM_DOWNLOAD_MAX_BANDWIDTH', 0))
+
+# How many installers a Brave Manager process downloads from the same host at
+# the same time. Further downloads wait.
+DOWNLOADS_PER_HOST = int(getenv('BM_DOWNLOADS_PER_HOST', 2))
+
+# The cache is pruned to this many bytes by evicting the installers that were
+# least recently used.
+CACHE_MAX_SIZE = int(getenv('BM_CACHE_MAX_SIZE', 10 * 10 ** 9))
+
+# `bm prefetch` downloads this many of the newest versions of each channel,
+# with the installers whose names contain one of these comma-separated parts.
+PREFETCH_NUM_VERSIONS = int(getenv('BM_PREFETCH_NUM_VERSIONS', 1))
+PREFETCH_INSTALLERS = getenv('BM_PREFETCH_INSTALLERS', 'universal').split(',')
+
+# `bm prefetch` runs in the background, eg. via cron. So it downloads at most
+# this many installers at a time, with at most this many bytes per second
+# overall. 0 means no limit on the bandwidth.
+PREFETCH_NUM_DOWNLOADS = int(getenv('BM_PREFETCH_NUM_DOWNLOADS', 2))
+PREFETCH_MAX_BANDWIDTH = int(getenv('BM_PREFETCH_MAX_BANDWIDTH', 10 * 10 ** 6))
+
+# Each run appends how long its phases took to this file, as JSON lines. See
+# impl/timing.py. An empty value turns this off.
+TIMING_LOG = getenv(
+    'BM_TIMING_LOG', expanduser('~/Library/Logs/brave-manager/timing.jsonl')
+)
@@ -0,0 +1,294 @@
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from impl import config, net, timing
+from math import ceil
+from os import remove, replace
+from os.path import getsize
+from queue import Queue, Empty
+from threading import BoundedSemaphore, Event, Lock
+from time import monotonic, sleep
+from urllib.parse import urlsplit
+
+import json
+
+# Files smaller than this are not split into segments:
+_MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+
+_BLOCK_SIZE = 1024 * 1024
+
+# How often to save the progress of a download, in seconds:
+_SAVE_STATE_INTERVAL = 1
+
+# Downloads to `path` + '.part' and renames the file to `path` only once it is
+# complete. If the server supports it, then the file is split into segments
+# that are downloaded in parallel. The progress of each segment is saved to
+# `path` + '.part.json', so an interrupted download can be resumed.
+# The SHA-256 digest of the file is computed while it is being downloaded.
+# Pass a BandwidthLimit to limit how fast the file is downloaded.
+# `source` is where the bytes of `url` are fetched from, eg. a mirror. It
+# defaults to `url`. All sources serve the same bytes, so the saved progress
+# belongs to `url`, and a download that was interrupted can be resumed from
+# another source.
+class FileDownloader:
+    def __init__(
+        self, url, path, num_connections=None, bandwidth_limit=None,
+        source=None
+    ):
+        self.url = url
+        self.source = source or url
+        self.path = path
+        self.num_connections = num_connections or config.DOWNLOAD_CONNECTIONS
+        self.bandwidth_limit = bandwidth_limit
+        self.part_path = path + '.part'
+        self.state_path = path + '.part.json'
+        self.total_size = 0
+        self._response = None
+        self._segment_url = None
+        # Each segment is a list [start, end, num_bytes_downloaded], where
+        # `end` is exclusive.
+        self._segments = None
+        self._hasher = None
+    def start(self):
+        response = net.get(self.source, stream=True)
+        response.raise_for_status()
+        self.total_size = int(response.headers.get('content-length', 0))
+        supports_ranges = response.headers.get('accept-ranges') == 'bytes'
+        if self.total_size and supports_ranges:
+            # Close the connection and instead fetch the individual segments.
+            # Use the URL after redirects, so each segment does not have to
+            # follow them again.
+            self._segment_url = response.url
+            response.close()
+            self._segments = self._load_segments() or self._create_segments()
+        else:
+            self._response = response
+        return self.total_size
+    def get_num_bytes_downloaded(self):
+        if not self._segments:
+            return 0
+        return sum(num_bytes for _, _, num_bytes in self._segments)
+    def run(self):
+        num_connections = len(self._segments) if self._segments else 1
+        with timing.span(
+            'download', url=self.url, source=self.source,
+            connections=num_connections, bytes=0
+        ) as record:
+            if self._segments:
+                chunks = self._run_segments()
+            else:
+                chunks = self._run_single_connection()
+            for num_bytes in chunks:
+                record['bytes'] += num_bytes
+                yield num_bytes
+            replace(self.part_path, self.path)
+    def get_sha256(self):
+        return self._hasher.hexdigest()
+    def _run_single_connection(self):
+        self._hasher = sha256()
+        num_bytes_downloaded = 0
+        with self._response, open(self.part_path, 'wb') as f:
+            for data in self._response.iter_content(_BLOCK_SIZE):
+                if self.bandwidth_limit:
+                    self.bandwidth_limit.consume(len(data))
+                f.write(data)
+                self._hasher.update(data)
+                num_bytes_downloaded += len(data)
+                yield len(data)
+        if self.total_size and num_bytes_downloaded != self.total_size:
+            raise RuntimeError(f'Download of {self.url} was cut short.')
+    def _run_segments(self):
+        queue = Queue()
+        stop = Event()
+        self._hasher = _SequentialHasher(self.part_path, self._segments)
+        segments = [s for s in self._segments if s[0] + s[2] < s[1]]
+        executor = ThreadPoolExecutor(max(len(segments), 1))
+        for segment in segments:
+            executor.submit(self._download_segment, segment, queue, stop)
+        try:
+            num_running = len(segments)
+            last_saved = monotonic()
+            while num_running:
+                try:
+                    item = queue.get(timeout=_SAVE_STATE_INTERVAL)
+                except Empty:
+                    pass
+                else:
+                    if item is None:
+                        num_running -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        offset, data = item
+                        self._hasher.update(offset, data)
+                        yield len(data)
+                if monotonic() - last_saved >= _SAVE_STATE_INTERVAL:
+                    self._save_state()
+                    last_saved = monotonic()
+        except BaseException:
+            # Ctrl+C, an error or the caller stopped iterating. Remember what
+            # we have so far, so the download can be resumed.
+            stop.set()
+            self._save_state()
+            raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        try:
+            remove(self.state_path)
+        except FileNotFoundError:
+            pass
+    def _download_segment(self, segment, queue, stop):
+        try:
+            start, end, _ = segment
+            headers = {'Range': f'bytes={start + segment[2]}-{end - 1}'}
+            with net.get(self._segment_url, headers=headers, stream=True) \
+                    as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise RuntimeError(
+                        'Server did not respect range request for '
+                        f'{self.source}.'
+                    )
+                # Each thread has its own file descriptor, so it can finish
+                # writing independently of the others.
+                with open(self.part_path, 'r+b') as f:
+                    for data in response.iter_content(_BLOCK_SIZE):
+                        if stop.is_set():
+                            return
+                        offset = start + segment[2]
+                        data = data[:end - offset]
+                        if self.bandwidth_limit:
+                            self.bandwidth_limit.consume(len(data))
+                        f.seek(offset)
+                        f.write(data)
+                        # Make the data visible to _SequentialHasher.
+                        f.flush()
+                        segment[2] += len(data)
+                        queue.put((offset, data))
+            if start + segment[2] < end:
+                raise RuntimeError(f'Download of {self.url} was cut short.')
+        except Exception as e:
+            queue.put(e)
+        else:
+            queue.put(None)
+    def _create_segments(self):
+        num_segments = min(
+            self.num_connections, ceil(self.total_size / _MIN_SEGMENT_SIZE)
+        )
+        segment_size = ceil(self.total_size / num_segments)
+        with open(self.part_path, 'wb') as f:
+            # Reserve the space up front.
+            f.truncate(self.total_size)
+        return [
+            [start, min(start + segment_size, self.total_size), 0]
+            for start in range(0, self.total_size, segment_size)
+        ]
+    def _load_segments(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            part_size = getsize(self.part_path)
+        except (FileNotFoundError, ValueError):
+            return None
+        if state.get('url') != self.url \
+                or state.get('size') != self.total_size \
+                or part_size != self.total_size:
+            return None
+        return state['segments']
+    def _save_state(self):
+        state = {
+            'url': self.url,
+            'size': self.total_size,
+            'segments': self._segments
+        }
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        replace(tmp_path, self.state_path)
+
+# Limits the combined speed of all downloads that share it. Each download waits
+# until the data it received fits into the limit.
+class BandwidthLimit:
+    def __init__(self, bytes_per_second, parent=None):
+        # The bytes also count towards `parent`, another BandwidthLimit. Eg.
+        # a limit for prefetching within the overall limit.
+        self.bytes_per_second = bytes_per_second
+        self.parent = parent
+        self._lock = Lock()
+        self._next_time = monotonic()
+    def consume(self, num_bytes):
+        delay = self._reserve(num_bytes)
+        if delay > 0:
+            sleep(delay)
+    def _reserve(self, num_bytes):
+        # Returns how long to wait before the bytes may be used.
+        with self._lock:
+            now = monotonic()
+            # Let a download that was idle catch up by at most one second.
+            self._next_time = max(self._next_time, now - 1)
+            self._next_time += num_bytes / self.bytes_per_second
+            delay = self._next_time - now
+        if self.parent is not None:
+            delay = max(delay, self.parent._reserve(num_bytes))
+        return delay
+
+def get_shared_bandwidth_limit():
+    # Returns the BandwidthLimit that all downloads of this process share, as
+    # per config.DOWNLOAD_MAX_BANDWIDTH. Or None if there is no limit.
+    global _shared_bandwidth_limit
+    if not config.DOWNLOAD_MAX_BANDWIDTH:
+        return None
+    with _shared_lock:
+        if _shared_bandwidth_limit is None:
+            _shared_bandwidth_limit = \
+                BandwidthLimit(config.DOWNLOAD_MAX_BANDWIDTH)
+        return _shared_bandwidth_limit
+
+def get_host_semaphore(url):
+    # Returns the semaphore that limits how many files this process downloads
+    # from the host of `url` at the same time, as per
+    # config.DOWNLOADS_PER_HOST.
+    host = urlsplit(url).netloc
+    with _shared_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = \
+                BoundedSemaphore(max(config.DOWNLOADS_PER_HOST, 1))
+        return _host_semaphores[host]
+
+_shared_bandwidth_limit = None
+_host_semaphores = {}
+_shared_lock = Lock()
+
+# Hashes a file in order while its segments are downloaded in parallel. Data at
+# the current position is hashed as soon as it arrives. Data further ahead has
+# already been written to disk. It is read back, usually from the OS's page
+# cache, once the position reaches it.
+class _SequentialHasher:
+    def __init__(self, path, segments):
+        self._path = path
+        self._segments = segments
+        self._position = 0
+        self._hash = sha256()
+    def update(self, offset, data):
+        if offset == self._position:
+            self._hash.update(data)
+            self._position += len(data)
+        self._catch_up()
+    def hexdigest(self):
+        self._catch_up()
+        return self._hash.hexdigest()
+    def _catch_up(self):
+        for start, end, num_bytes_downloaded in self._segments:
+            if not start <= self._position < end:
+                continue
+            downloaded_end = start + num_bytes_downloaded
+            if downloaded_end <= self._position:
+                return
+            with open(self._path, 'rb') as f:
+                f.seek(self._position)
+                while self._position < downloaded_end:
+                    num_bytes = min(
+                        _BLOCK_SIZE, downloaded_end - self._position
+                    )
+                    block = f.read(num_bytes)
+                    self._hash.update(block)
+                    self._position += len(block)
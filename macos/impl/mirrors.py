@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from impl import config, net, timing
+
+import concurrent.futures
+
+# When many machines install the same version of Brave, then they don't all
+# need to download it from GitHub. Instead, they can use a mirror, such as a
+# machine in the same office that serves its cache of installers via HTTP.
+# A mirror serves each installer at its URL without the scheme. For example,
+#     https://github.com/brave/brave-browser/releases/download/v1.2.3/Brave.dmg
+# at
+#     http://mirror:8000/github.com/brave/brave-browser/releases/download/...
+# This is the layout of Brave Manager's cache. So running
+# `python3 -m http.server` in its .cache directory makes a mirror.
+
+def get_sources(url, mirrors=None):
+    # Returns the URLs to try to download `url` from, in order: The mirrors
+    # that have the file, fastest first, and then `url` itself. `mirrors`
+    # defaults to config.DOWNLOAD_MIRRORS. A mirror's copy is only used if it
+    # has the size that `url` reports. Otherwise, it is incomplete or another
+    # file, and its SHA-256 would end up in the cache's manifest.
+    if mirrors is None:
+        mirrors = config.DOWNLOAD_MIRRORS
+    if not mirrors:
+        return [url]
+    mirror_urls = [get_mirror_url(m, url) for m in mirrors]
+    # The size of each mirror that responded, in the order in which they did.
+    sizes = {}
+    with timing.span('mirrors.probe', num_mirrors=len(mirrors)):
+        executor = ThreadPoolExecutor(len(mirror_urls) + 1)
+        # With the usual retries and timeouts. Mirrors are meant for slow
+        # links, on which the redirect from GitHub to its CDN can take longer
+        # than MIRROR_TIMEOUT.
+        expected_size_future = executor.submit(_get_size, url)
+        # Without retries, because we only wait for MIRROR_TIMEOUT anyway.
+        futures = {
+            executor.submit(
+                _get_size, mirror_url, num_retries=0,
+                timeout=config.MIRROR_TIMEOUT
+            ): mirror_url
+            for mirror_url in mirror_urls
+        }
+        try:
+            for future in as_completed(futures, config.MIRROR_TIMEOUT):
+                sizes[futures[future]] = future.result()
+        except concurrent.futures.TimeoutError:
+            # Don't wait for mirrors that are slower than that.
+            pass
+        try:
+            expected_size = expected_size_future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    if expected_size is None:
+        # We can't check the mirrors. Let the download from `url` report why.
+        return [url]
+    result = [
+        mirror_url for mirror_url, size in sizes.items()
+        if size == expected_size
+    ]
+    return result + [url]
+
+def get_mirror_url(mirror, url):
+    return f'{mirror.rstrip("/")}/{url.split("//", 1)[1]}'
+
+def _get_size(url, **kwargs):
+    # Returns the Content-Length of `url`, or None if it is not available.
+    try:
+        response = net.head(url, allow_redirects=True, **kwargs)
+    except OSError:
+        return None
+    if response.status_code != 200:
+        return None
+    try:
+        return int(response.headers['content-length'])
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,58 @@
+from impl import config
+from threading import Lock
+
+# Enough connections per host for our largest number of parallel requests.
+_POOL_SIZE = 16
+
+# One session per number of retries:
+_sessions = {}
+_sessions_lock = Lock()
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', (config.CONNECT_TIMEOUT, config.READ_TIMEOUT))
+    return get_session().get(url, **kwargs)
+
+def post(url, **kwargs):
+    kwargs.setdefault('timeout', (config.CONNECT_TIMEOUT, config.READ_TIMEOUT))
+    return get_session().post(url, **kwargs)
+
+def head(url, num_retries=None, **kwargs):
+    kwargs.setdefault('timeout', (config.CONNECT_TIMEOUT, config.READ_TIMEOUT))
+    return get_session(num_retries).head(url, **kwargs)
+
+def github_api_url(path):
+    return config.GITHUB_API_URL.rstrip('/') + path
+
+def get_session(num_retries=None):
+    # A single session for the whole process, so connections are kept alive
+    # and re-used across requests. Requests that must fail fast, such as
+    # checking whether a mirror is up, can use a session with fewer retries.
+    if num_retries is None:
+        num_retries = config.NUM_RETRIES
+    with _sessions_lock:
+        if num_retries not in _sessions:
+            _sessions[num_retries] = _create_session(num_retries)
+        return _sessions[num_retries]
+
+def _create_session(num_retries):
+    # Importing requests takes a noticeable fraction of our startup time. So
+    # only do it once we need it.
+    from requests.adapters import HTTPAdapter
+    from urllib3.util import Retry
+    import requests
+    retry = Retry(
+        total=num_retries,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=('GET', 'HEAD'),
+        # Return the last response instead of raising, so callers can handle
+        # it via response.raise_for_status().
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=_POOL_SIZE, pool_maxsize=_POOL_SIZE, max_retries=retry
+    )
+    result = requests.Session()
+    result.mount('https://', adapter)
+    result.mount('http://', adapter)
+    return result
@@ -0,0 +1,102 @@
+import json
+import sqlite3
+
+# The trimmed release records are kept in table `releases`. Those that can be
+# installed on macOS are also described in table `installable`, which has one
+# row per release with the columns needed to list a channel's releases in
+# order. Table `metadata` holds small JSON values, such as when we last
+# fetched releases from GitHub.
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS releases (
+    id TEXT PRIMARY KEY,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS installable (
+    id TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    major INTEGER NOT NULL,
+    minor INTEGER NOT NULL,
+    patch INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    published_at TEXT NOT NULL,
+    prerelease INTEGER NOT NULL,
+    installers TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS installable_by_channel ON installable (
+    channel, major DESC, minor DESC, patch DESC, published_at DESC
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+class ReleaseStore:
+    def __init__(self, path):
+        # Wait for other Brave Manager processes that may be writing.
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.executescript(_SCHEMA)
+    def __enter__(self):
+        return self
+    def __exit__(self, *_):
+        self.close()
+    def close(self):
+        self._connection.close()
+    def get_ids(self):
+        cursor = self._connection.execute('SELECT id FROM releases')
+        return {release_id for release_id, in cursor}
+    def add(self, releases):
+        # `releases` is an iterable of (id, record, installable), where
+        # `installable` is None or the result of releases._get_installable().
+        # Releases that are already in the store are left untouched.
+        with self._connection:
+            for release_id, record, installable in releases:
+                cursor = self._connection.execute(
+                    'INSERT OR IGNORE INTO releases VALUES (?, ?)',
+                    (release_id, json.dumps(record))
+                )
+                if not cursor.rowcount or installable is None:
+                    continue
+                channel, release = installable
+                major, minor, patch = map(int, release['version'].split('.'))
+                self._connection.execute(
+                    'INSERT INTO installable '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        release_id, channel, major, minor, patch,
+                        release['name'], release['published_at'],
+                        release['prerelease'],
+                        json.dumps(release['installers'])
+                    )
+                )
+    def get_installable(self, channel, public_only):
+        query = \
+            'SELECT major, minor, patch, name, published_at, prerelease, ' \
+            'installers FROM installable WHERE channel = ?'
+        if public_only:
+            query += ' AND NOT prerelease'
+        query += \
+            ' ORDER BY major DESC, minor DESC, patch DESC, published_at DESC'
+        result = []
+        for major, minor, patch, name, published_at, prerelease, installers \
+                in self._connection.execute(query, (channel,)):
+            result.append({
+                'version': f'{major}.{minor}.{patch}',
+                'name': name,
+                'published_at': published_at,
+                'prerelease': bool(prerelease),
+                'installers': json.loads(installers)
+            })
+        return result
+    def get_value(self, key, default=None):
+        cursor = self._connection.execute(
+            'SELECT value FROM metadata WHERE key = ?', (key,)
+        )
+        row = cursor.fetchone()
+        return default if row is None else json.loads(row[0])
+    def set_value(self, key, value):
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO metadata VALUES (?, ?)',
+                (key, json.dumps(value))
+            )
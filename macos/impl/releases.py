@@ -1,131 +1,456 @@
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import count, islice
 from math import ceil
-from os.path import join, dirname, basename, getmtime
+from os import remove, replace
+from os.path import join, dirname, exists, getmtime
+from threading import Lock, Thread
 from time import time
-from impl import cache
+from impl import cache, net, timing, CHANNELS
+from impl.release_store import ReleaseStore
+from impl.streaming_json import iter_array
 from impl.util import extract_version
 from zipfile import ZipFile, ZIP_DEFLATED
 
 import json
-import requests
-import sys
 
 # Github's API only gives us the latest 1000 releases. We remember older
-# releases in this compressed JSON file. It can be updated with
+# releases in this Zip file of JSON files. It can be updated with
 # update_historic_releases(...) below. A CLI to this function is in
 # `update_historic_releases.py`.
 HISTORIC_RELEASES = join(dirname(__file__), 'historic-releases.zip')
 
+_RELEASES_PATH = '/repos/brave/brave-browser/releases'
+
+# How many pages of releases to fetch from GitHub's API in parallel.
+NUM_CONCURRENT_PAGE_REQUESTS = 4
+
+# How many tags update_historic_releases(...) looks up in parallel via the
+# REST API, or per request via the GraphQL API.
+NUM_CONCURRENT_TAG_REQUESTS = 8
+GRAPHQL_BATCH_SIZE = 50
+
+# GitHub's API is slow. So we only re-fetch releases this often.
+_REFRESH_INTERVAL = 15 * 60
+
+_background_refresh = None
+_background_refresh_error = None
+
+def start_background_refresh():
+    # Fetches new releases from GitHub on a background thread, while the user
+    # answers other questions. Until the thread is done, get_releases(...)
+    # returns the releases that are already in the cache instead of waiting.
+    # Unless they were never fetched from GitHub. Then the cache only has the
+    # historic releases, which may be months old, and get_releases(...) waits.
+    global _background_refresh
+    _background_refresh = Thread(target=_refresh_in_background, daemon=True)
+    _background_refresh.start()
+
 def get_releases(channel, public_only):
-    result = []
-    for release in _cache_releases():
-        if not release['name'].startswith(channel.title()):
-            continue
-        if public_only and release['prerelease']:
-            continue
-        try:
-            version = extract_version(release['tag_name'])
-        except ValueError:
-            continue
-        installers_this_version = {
-            asset['name']: asset['browser_download_url']
-            for asset in release['assets']
-            if asset['name'].endswith('.dmg') or asset['name'].endswith('.pkg')
-        }
-        if installers_this_version:
-            result.append({
-                'version': version,
-                'name': release['name'].rstrip(),
-                'published_at': release['published_at'],
-                'installers': installers_this_version
-            })
-    return result
+    # Returns the releases of the given channel that have installers, newest
+    # first. This is cheap once the cache is up to date. So callers can call
+    # it again to pick up releases found by a background refresh.
+    with _cache_releases(channel) as store:
+        return store.get_installable(channel, public_only)
 
 def group_by_minor_version(releases):
+    # Preserves the order of `releases`. So if they are sorted, then so are
+    # the minor versions.
     result = defaultdict(list)
     for release in releases:
         minor_version = release['version'].rsplit('.', 1)[0]
         result[f'{minor_version}.x'].append(release)
     return result
 
-def update_historic_releases(tags, github_token, clear_existing=False):
-    zipped_json = ZippedJson(HISTORIC_RELEASES)
+def update_historic_releases(
+    tags, github_token, clear_existing=False,
+    num_workers=NUM_CONCURRENT_TAG_REQUESTS, use_graphql=False
+):
+    # Fetches the releases for the given tags. When GitHub's rate limit is
+    # (nearly) exhausted, then we yield the number of seconds to wait. The
+    # caller must sleep for that long before it continues to iterate.
+    # By default, we use the REST API with `num_workers` parallel requests.
+    # The GraphQL API instead looks up many tags per request.
+    historic_releases_zip = HistoricReleases(HISTORIC_RELEASES)
     if clear_existing:
-        zipped_json.write({})
-    historic_releases = zipped_json.read()
+        historic_releases_zip.write({})
+    historic_releases = historic_releases_zip.read_all()
     cached_tag_names = {
         info['tag_name'] for info in historic_releases.values()
     }
+    tags_to_fetch = (tag for tag in tags if tag not in cached_tag_names)
+    headers = {'Authorization': f'Bearer {github_token}'}
     try:
-        for tag in tags:
-            if tag in cached_tag_names:
-                continue
-            url = f'https://api.github.com/repos/brave/brave-browser/releases/'\
-                  f'tags/{tag}'
-            headers = {'Authorization': f'Bearer {github_token}'}
-            response = requests.get(url, headers=headers)
-            if response.status_code == 403 \
-                    and response.headers.get('x-ratelimit-remaining') == '0':
-                ratelimit_reset = int(response.headers['x-ratelimit-reset'])
-                wait_time = ceil(ratelimit_reset - time())
-                yield wait_time
-                response = requests.get(url, headers=headers)
-            if response.status_code == 404:
+        # Each release is appended to a journal as soon as it is fetched, so
+        # it survives crashes. read_all() above picks up the journal of a
+        # previous run. It is folded into the Zip file at the end.
+        with historic_releases_zip.open_journal() as journal:
+            def add_release(release):
+                cache_id = _get_cache_id(release)
+                release_thin = _trim_github_release(release)
+                historic_releases[cache_id] = release_thin
+                journal.append(cache_id, release_thin)
+            if use_graphql:
+                yield from _fetch_historic_releases_via_graphql(
+                    tags_to_fetch, headers, add_release
+                )
+            else:
+                yield from _fetch_historic_releases_via_rest(
+                    tags_to_fetch, headers, num_workers, add_release
+                )
+    finally:
+        # Only this thread modifies historic_releases. So it is consistent
+        # even if we were interrupted.
+        if historic_releases_zip.has_journal():
+            historic_releases_zip.write(historic_releases)
+
+def _fetch_historic_releases_via_rest(tags, headers, num_workers, on_release):
+    # Looks up the tags in parallel. All workers are paused when the rate
+    # limit is (nearly) exhausted.
+    tags = iter(tags)
+    # Tags that have to be fetched (again) before we continue with `tags`:
+    tags_to_retry = deque()
+    rate_limit = _RateLimit()
+    executor = ThreadPoolExecutor(num_workers)
+    pending = set()
+    try:
+        while True:
+            while len(pending) < num_workers \
+                    and rate_limit.allows(len(pending)):
+                tag = tags_to_retry.popleft() if tags_to_retry \
+                    else next(tags, None)
+                if tag is None:
+                    break
+                pending.add(executor.submit(
+                    _fetch_historic_release, tag, headers, rate_limit
+                ))
+            if not pending:
+                if not tags_to_retry:
+                    tag = next(tags, None)
+                    if tag is None:
+                        break
+                    tags_to_retry.append(tag)
+                yield rate_limit.get_wait_time()
+                rate_limit.forget()
                 continue
-            response.raise_for_status()
-            release = response.json()
-            cache_id = _get_cache_id(release)
-            historic_releases[cache_id] = _trim_github_release(release)
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tag, release = future.result()
+                if release is _RATE_LIMITED:
+                    tags_to_retry.append(tag)
+                elif release is not None:
+                    on_release(release)
     finally:
-        zipped_json.write(historic_releases)
+        executor.shutdown(wait=False, cancel_futures=True)
 
-def _cache_releases():
-    cache_path = cache.prepare('releases.json')
+def _fetch_historic_releases_via_graphql(tags, headers, on_release):
+    rate_limit = _RateLimit()
+    tags = iter(tags)
+    while True:
+        batch = list(islice(tags, GRAPHQL_BATCH_SIZE))
+        if not batch:
+            break
+        query = '{ repository(owner: "brave", name: "brave-browser") { ' + \
+            ' '.join(
+                f'r{i}: release(tagName: {json.dumps(tag)}) '
+                f'{{ {_GRAPHQL_RELEASE_FIELDS} }}'
+                for i, tag in enumerate(batch)
+            ) + ' } }'
+        data = yield from _query_graphql(query, {}, headers, rate_limit)
+        for release in data['repository'].values():
+            # The release is None if there is none for the tag.
+            if release is None:
+                continue
+            assets = release['releaseAssets']
+            asset_nodes = list(assets['nodes'])
+            while assets['pageInfo']['hasNextPage']:
+                variables = {
+                    'tag': release['tagName'],
+                    'after': assets['pageInfo']['endCursor']
+                }
+                more_data = yield from _query_graphql(
+                    _GRAPHQL_MORE_ASSETS_QUERY, variables, headers, rate_limit
+                )
+                assets = more_data['repository']['release']['releaseAssets']
+                asset_nodes.extend(assets['nodes'])
+            on_release(_convert_graphql_release(release, asset_nodes))
+
+def _query_graphql(query, variables, headers, rate_limit):
+    # A generator that yields wait times for the rate limit like
+    # update_historic_releases(...) and then returns the response's data.
+    while True:
+        if not rate_limit.allows(0):
+            yield rate_limit.get_wait_time()
+            rate_limit.forget()
+        response = net.post(
+            net.github_api_url('/graphql'), headers=headers,
+            json={'query': query, 'variables': variables}
+        )
+        rate_limit.update(response.status_code, response.headers)
+        if not rate_limit.is_rate_limited(
+            response.status_code, response.headers
+        ):
+            break
+    response.raise_for_status()
+    result = response.json()
+    # Missing releases are reported as errors of type NOT_FOUND. They don't
+    # prevent the other releases from being returned.
+    errors = [
+        error for error in result.get('errors', [])
+        if error.get('type') != 'NOT_FOUND'
+    ]
+    if errors or not result.get('data'):
+        raise RuntimeError(f'GitHub GraphQL query failed: {errors}')
+    return result['data']
+
+def _convert_graphql_release(release, asset_nodes):
+    # Returns the release in the shape returned by GitHub's REST API.
+    return {
+        'id': release['databaseId'],
+        'name': release['name'],
+        'tag_name': release['tagName'],
+        'prerelease': release['isPrerelease'],
+        'assets': [
+            {
+                'name': asset['name'],
+                'browser_download_url': asset['downloadUrl']
+            }
+            for asset in asset_nodes
+        ],
+        'published_at': release['publishedAt']
+    }
+
+_GRAPHQL_RELEASE_FIELDS = \
+    'databaseId name tagName isPrerelease publishedAt ' \
+    'releaseAssets(first: 100) { pageInfo { hasNextPage endCursor } ' \
+    'nodes { name downloadUrl } }'
+
+_GRAPHQL_MORE_ASSETS_QUERY = \
+    'query($tag: String!, $after: String!) { ' \
+    'repository(owner: "brave", name: "brave-browser") { ' \
+    'release(tagName: $tag) { ' \
+    'releaseAssets(first: 100, after: $after) { ' \
+    'pageInfo { hasNextPage endCursor } nodes { name downloadUrl } } } } }'
+
+def _fetch_historic_release(tag, headers, rate_limit):
+    # Returns (tag, release). `release` is None if there is no release for the
+    # tag, or _RATE_LIMITED if the request has to be retried later.
+    url = net.github_api_url(f'{_RELEASES_PATH}/tags/{tag}')
+    response = net.get(url, headers=headers)
+    rate_limit.update(response.status_code, response.headers)
+    if rate_limit.is_rate_limited(response.status_code, response.headers):
+        return tag, _RATE_LIMITED
+    if response.status_code == 404:
+        return tag, None
+    response.raise_for_status()
+    return tag, response.json()
+
+_RATE_LIMITED = object()
+
+class _RateLimit:
+
+    # GitHub's rate limit, as reported by the responses of all workers.
+
+    def __init__(self):
+        self._lock = Lock()
+        self._remaining = None
+        self._reset = None
+
+    def update(self, status_code, headers):
+        with self._lock:
+            if 'retry-after' in headers \
+                    and self.is_rate_limited(status_code, headers):
+                # A secondary rate limit, eg. for too many concurrent requests.
+                self._remaining = 0
+                self._reset = time() + int(headers['retry-after'])
+                return
+            try:
+                remaining = int(headers['x-ratelimit-remaining'])
+                reset = int(headers['x-ratelimit-reset'])
+            except (KeyError, ValueError):
+                return
+            # Responses can arrive out of order. Only the lowest number of
+            # remaining requests in the latest time window is accurate.
+            if self._reset is None or reset > self._reset \
+                    or (reset == self._reset and remaining < self._remaining):
+                self._remaining = remaining
+                self._reset = reset
+
+    def is_rate_limited(self, status_code, headers):
+        return status_code in (403, 429) and (
+            headers.get('x-ratelimit-remaining') == '0'
+            or 'retry-after' in headers
+        )
+
+    def allows(self, num_requests_in_flight):
+        with self._lock:
+            return self._remaining is None \
+                or self._remaining > num_requests_in_flight
+
+    def get_wait_time(self):
+        with self._lock:
+            if self._reset is None:
+                return 0
+            return max(ceil(self._reset - time()), 0)
+
+    def forget(self):
+        with self._lock:
+            self._remaining = None
+            self._reset = None
+
+@timing.timed('releases.cache')
+def _cache_releases(channel):
+    # Brings the releases of the given channel in the cache up to date and
+    # returns the store that contains them.
+    store = ReleaseStore(cache.prepare('releases.sqlite3'))
     try:
-        cache_mtime = getmtime(cache_path)
-    except FileNotFoundError:
-        recreate_cache = True
-    else:
-        # GitHub's API is slow; Only re-fetch releases every 15 minutes.
-        fetch_releases = time() - cache_mtime > 15 * 60
-        with open(cache_path) as f:
-            cached_releases = json.load(f)
-        recreate_cache = getmtime(HISTORIC_RELEASES) > cache_mtime
-    if recreate_cache:
-        historic_releases = ZippedJson(HISTORIC_RELEASES).read()
-        with open(cache_path, 'w') as f:
-            json.dump(historic_releases, f)
-        fetch_releases = True
-        cached_releases = historic_releases
-    if not fetch_releases:
-        yield from cached_releases.values()
+        _migrate_json_cache(store)
+        # Only import the historic releases of the channel we need. This
+        # happens again for each channel after historic-releases.zip changes.
+        historic_releases_mtime = getmtime(HISTORIC_RELEASES)
+        mtime_key = f'historic_releases_mtime.{channel}'
+        if store.get_value(mtime_key) != historic_releases_mtime:
+            with timing.span('releases.import', channel=channel):
+                historic_releases = HistoricReleases(HISTORIC_RELEASES)
+                _add_releases(store, historic_releases.read_channel(channel))
+                store.set_value(mtime_key, historic_releases_mtime)
+        if _background_refresh is None:
+            _refresh(store)
+        else:
+            _check_background_refresh(store)
+    except BaseException:
+        store.close()
+        raise
+    return store
+
+def _refresh_in_background():
+    global _background_refresh_error
+    try:
+        with ReleaseStore(cache.prepare('releases.sqlite3')) as store:
+            _refresh(store)
+    except Exception as e:
+        # Don't print anything, as it would garble the menu. Instead,
+        # get_releases(...) reports the error.
+        _background_refresh_error = e
+
+def _check_background_refresh(store):
+    global _background_refresh_error
+    if store.get_value('fetched_at') is None:
+        _background_refresh.join()
+    error, _background_refresh_error = _background_refresh_error, None
+    if error is None:
+        return
+    # A RuntimeError means that historic-releases.zip is out of date. Then
+    # releases are missing until the user updates it.
+    if isinstance(error, RuntimeError) \
+            or store.get_value('fetched_at') is None:
+        raise error
+    # Eg. we are offline. The releases in the cache have to do for now.
+    print(f'Could not fetch new releases from GitHub: {error}')
+
+def _refresh(store):
+    if not _needs_refresh(store):
         return
+    # If another Brave Manager process is fetching releases, then wait for it
+    # and use its results instead of fetching them a second time.
+    with cache.lock('releases'):
+        if _needs_refresh(store):
+            _fetch_new_releases(store)
+
+def _needs_refresh(store):
+    return time() - store.get_value('fetched_at', 0) > _REFRESH_INTERVAL
+
+def _fetch_new_releases(store):
+    validators = store.get_value('page_validators', {})
+    # The store may not contain the historic releases of all channels yet.
+    # We still want to stop at the first release we know of.
+    known_ids = set(HistoricReleases(HISTORIC_RELEASES).read_ids())
+    known_ids.update(store.get_ids())
+    new_validators = dict(validators)
     new_items = {}
-    rest_is_in_cache = False
-    for page_results in _paginate_releases():
-        for release in page_results:
-            cache_id = _get_cache_id(release)
-            if cache_id in cached_releases:
-                rest_is_in_cache = True
-                break
-            else:
-                release_thin = _trim_github_release(release)
-                new_items[cache_id] = release_thin
-                yield release_thin
-        if rest_is_in_cache:
-            break
-    yield from cached_releases.values()
-    if new_items:
-        cached_releases.update(new_items)
-        with open(cache_path, 'w') as f:
-            json.dump(cached_releases, f)
+    pages = _paginate_releases(new_validators, known_ids.__contains__)
+    for page_items in pages:
+        new_items.update(page_items)
+    # Store the releases before the validators. Otherwise, if we were
+    # interrupted in between, then the next fetch could be "304 Not Modified"
+    # and we would never learn about the releases.
+    _add_releases(store, new_items)
+    if new_validators != validators:
+        store.set_value('page_validators', new_validators)
+    store.set_value('fetched_at', time())
+
+def _migrate_json_cache(store):
+    # Brave Manager used to keep its releases in releases.json, along with an
+    # index and the validators of the pages fetched from GitHub's API.
+    json_path = join(cache.CACHE_DIR, 'releases.json')
+    try:
+        json_mtime = getmtime(json_path)
+    except FileNotFoundError:
+        return
+    with open(json_path) as f:
+        _add_releases(store, json.load(f))
+    historic_releases_mtime = getmtime(HISTORIC_RELEASES)
+    if json_mtime >= historic_releases_mtime:
+        # releases.json already contained the current historic releases.
+        for channel in CHANNELS:
+            mtime_key = f'historic_releases_mtime.{channel}'
+            store.set_value(mtime_key, historic_releases_mtime)
+    for file_name in (
+        'releases.json', 'release-index.json', 'releases-validators.json'
+    ):
+        try:
+            remove(join(cache.CACHE_DIR, file_name))
+        except FileNotFoundError:
+            pass
+
+def _add_releases(store, releases):
+    store.add(
+        (cache_id, release, _get_installable(release))
+        for cache_id, release in releases.items()
+    )
+
+def _get_installable(release):
+    # Returns (channel, release) with the information needed to install the
+    # given release on macOS. Or None if it can't be installed.
+    channel = _get_channel(release)
+    if channel is None:
+        return None
+    try:
+        version = extract_version(release['tag_name'])
+    except ValueError:
+        return None
+    installers = {
+        asset['name']: asset['browser_download_url']
+        for asset in release['assets']
+        if _is_installer(asset['name'])
+    }
+    if not installers:
+        return None
+    return channel, {
+        'version': version,
+        'name': release['name'].rstrip(),
+        'published_at': release['published_at'],
+        'prerelease': release['prerelease'],
+        'installers': installers
+    }
+
+def _is_installer(asset_name):
+    return asset_name.endswith('.dmg') or asset_name.endswith('.pkg')
+
+def _get_channel(release):
+    for channel in CHANNELS:
+        if release['name'].startswith(channel.title()):
+            return channel
+    return None
 
 def _get_cache_id(release):
     # Need str(...) because we want to use cache_id as a key in JSON, where keys
     # must be strings.
     return str(release['id'])
 
-def _trim_github_release(release):
+def _trim_github_release(release, installers_only=False):
+    # The historic releases keep all assets. Releases that we fetch for the
+    # cache only need the installers for macOS.
     return {
         'name': release['name'],
         'tag_name': release['tag_name'],
@@ -137,42 +462,190 @@ def _trim_github_release(release):
                     asset['browser_download_url']
             }
             for asset in release['assets']
+            if not installers_only or _is_installer(asset['name'])
         ],
         'published_at': release['published_at'],
     }
 
-def _paginate_releases():
-    for page in range(1, sys.maxsize):
-        url = f'https://api.github.com/repos/brave/brave-browser/releases?' \
-              f'per_page=100&page={page}'
-        response = requests.get(url)
+def _paginate_releases(
+    validators, is_known, num_workers=NUM_CONCURRENT_PAGE_REQUESTS
+):
+    # Yields the releases on each page that come before the first release for
+    # which `is_known(cache_id)` is true, as lists of (cache_id, release)
+    # pairs. `validators` maps page numbers to the ETag / Last-Modified
+    # headers of earlier responses. We send them with our requests and update
+    # them as pages arrive. When a page is "304 Not Modified", then all its
+    # releases were seen before. So we stop there, just like at an empty page
+    # or a known release.
+    executor = ThreadPoolExecutor(num_workers)
+    pages = count(1)
+    pending = deque()
+    # Usually, the first page already contains a release that is in the cache
+    # and we stop there. So only fetch further pages in parallel once the
+    # first page turns out to contain only new releases.
+    num_pages_in_flight = 1
+    try:
+        while True:
+            while len(pending) < num_pages_in_flight:
+                page = next(pages)
+                page_validators = validators.get(str(page), {})
+                future = executor.submit(
+                    _fetch_releases_page, page, page_validators, is_known
+                )
+                pending.append((page, future))
+            page, future = pending.popleft()
+            page_items, page_validators, is_last = future.result()
+            if page_validators:
+                validators[str(page)] = page_validators
+            if page_items:
+                yield page_items
+            if is_last:
+                return
+            num_pages_in_flight = num_workers
+    finally:
+        # Don't wait for requests whose results the caller no longer needs.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _fetch_releases_page(page, validators, is_known=lambda cache_id: False):
+    # Returns the (cache_id, release) pairs on the page that come before the
+    # first known release, the page's new validators and whether there can be
+    # no further new releases on later pages. The page is parsed while it is
+    # downloaded. So we can stop downloading it at the first known release,
+    # and only keep the parts of each release that we need.
+    url = net.github_api_url(f'{_RELEASES_PATH}?per_page=100&page={page}')
+    headers = {}
+    if 'etag' in validators:
+        headers['If-None-Match'] = validators['etag']
+    if 'last_modified' in validators:
+        headers['If-Modified-Since'] = validators['last_modified']
+    with timing.span('releases.fetch_page', page=page, bytes=0) as record, \
+            net.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return [], validators, True
         if page == 11 and response.status_code == 422:
             raise RuntimeError(
                 f'The GitHub API only returns 1000 releases but more were '
-                f'requested. This indicates that {HISTORIC_RELEASES} is out of '
-                f'date. Please update brave-manager or run '
+                f'requested. This indicates that {HISTORIC_RELEASES} is out '
+                f'of date. Please update brave-manager or run '
                 f'`python update_historic_releases.py` in its installation '
                 f'directory.'
             )
         response.raise_for_status()
-        yield response.json()
+        new_validators = {}
+        if 'etag' in response.headers:
+            new_validators['etag'] = response.headers['etag']
+        if 'last-modified' in response.headers:
+            new_validators['last_modified'] = response.headers['last-modified']
+        def iter_content():
+            for chunk in response.iter_content(_PAGE_CHUNK_SIZE):
+                record['bytes'] += len(chunk)
+                yield chunk
+        items = []
+        for release in iter_array(iter_content()):
+            cache_id = _get_cache_id(release)
+            if is_known(cache_id):
+                return items, new_validators, True
+            items.append(
+                (cache_id, _trim_github_release(release, installers_only=True))
+            )
+        return items, new_validators, not items
+
+# A page of 100 releases is about 1 MB. Most of it is a long list of assets
+# for other platforms.
+_PAGE_CHUNK_SIZE = 64 * 1024
 
-class ZippedJson:
+class HistoricReleases:
+
+    # The releases are split into one JSON file per channel inside the Zip
+    # file. This lets us decompress and parse only the channel we need.
+    # Releases of other channels, such as Android, are in other.json. Finally,
+    # ids.json lists the ids of all releases.
+    #
+    # Releases that are not yet in the Zip file can be appended to a journal
+    # next to it. read_all() includes them. write(...) replaces the Zip file
+    # atomically and then deletes the journal.
 
     def __init__(self, zip_path):
         self.zip_path = zip_path
+        self.journal_path = zip_path + '.journal'
+
+    def read_channel(self, channel):
+        return self._read_json_in_zip(f'{channel}.json')
+
+    def read_ids(self):
+        return self._read_json_in_zip('ids.json')
+
+    def read_all(self):
+        result = {}
+        for group in _HISTORIC_RELEASE_GROUPS:
+            result.update(self._read_json_in_zip(f'{group}.json'))
+        result.update(self._read_journal())
+        return result
+
+    def write(self, releases):
+        groups = {group: {} for group in _HISTORIC_RELEASE_GROUPS}
+        for cache_id, release in releases.items():
+            group = _get_channel(release) or 'other'
+            groups[group][cache_id] = release
+        tmp_path = self.zip_path + '.tmp'
+        with ZipFile(tmp_path, 'w', compression=ZIP_DEFLATED) as zf:
+            for group, group_releases in groups.items():
+                zf.writestr(f'{group}.json', json.dumps(group_releases))
+            zf.writestr('ids.json', json.dumps(list(releases)))
+        replace(tmp_path, self.zip_path)
+        try:
+            remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+    def has_journal(self):
+        return exists(self.journal_path)
+
+    def open_journal(self):
+        return _Journal(self.journal_path)
 
-    def read(self):
+    def _read_journal(self):
+        result = {}
+        try:
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        cache_id, release = json.loads(line)
+                    except ValueError:
+                        # The last line may be incomplete after a crash.
+                        continue
+                    result[cache_id] = release
+        except FileNotFoundError:
+            pass
+        return result
+
+    def _read_json_in_zip(self, name):
         with self._open_zip('r') as zf:
-            with zf.open(self._get_json_name_in_zip()) as f:
+            with zf.open(name) as f:
                 return json.load(f)
 
-    def write(self, data):
-        with self._open_zip('w', compression=ZIP_DEFLATED) as zf:
-            zf.writestr(self._get_json_name_in_zip(), json.dumps(data))
-
     def _open_zip(self, *args, **kwargs):
         return ZipFile(self.zip_path, *args, **kwargs)
 
-    def _get_json_name_in_zip(self):
-        return basename(self.zip_path).replace('.zip', '.json')
+_HISTORIC_RELEASE_GROUPS = CHANNELS + ('other',)
+
+class _Journal:
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        if self._file is not None:
+            self._file.close()
+
+    def append(self, cache_id, release):
+        # Only create the file when there is something to append.
+        if self._file is None:
+            self._file = open(self._path, 'a')
+        self._file.write(json.dumps([cache_id, release]) + '\n')
+        # Hand the data to the OS, so it survives if our process is killed.
+        self._file.flush()
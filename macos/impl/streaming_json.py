@@ -0,0 +1,89 @@
+from codecs import getincrementaldecoder
+from json import JSONDecoder, JSONDecodeError
+
+import re
+
+# Parsing a whole response with json.loads(...) keeps all of it in memory, and
+# we can only look at the first element once the last one has arrived. Instead,
+# iter_array(...) parses a JSON array while it is being downloaded. Each
+# element is decoded with the json module's fast raw_decode(...) as soon as it
+# is complete, and then only needs to be kept if the caller wants it.
+
+def iter_array(chunks):
+    # Yields the elements of the JSON array that is split across the given
+    # UTF-8 encoded byte strings, eg. response.iter_content(...). The caller
+    # can stop iterating at any point. Then the remaining chunks are not read.
+    # Raises ValueError if the data is not a JSON array.
+    reader = _Reader(chunks)
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.read_value()
+        separator = reader.read_char()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f'Expected , or ] but got {separator!r}.')
+
+class _Reader:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = getincrementaldecoder('utf-8')().decode
+        self._text = ''
+        self._pos = 0
+        self._is_at_end = False
+    def peek(self):
+        # Returns the next character that is not whitespace.
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._read_more():
+                raise ValueError('Unexpected end of JSON data.')
+    def read_char(self):
+        result = self.peek()
+        self._pos += 1
+        return result
+    def expect(self, char):
+        actual = self.read_char()
+        if actual != char:
+            raise ValueError(f'Expected {char} but got {actual!r}.')
+    def read_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._text, self._pos)
+            except JSONDecodeError:
+                # Usually, the value continues in the next chunk.
+                if self._is_at_end:
+                    raise
+            else:
+                # A number may continue in the next chunk, too. Eg. "-1." is
+                # decoded as -1. So the value must be followed by a delimiter.
+                is_complete = end < len(self._text) \
+                    and self._text[end] in _DELIMITERS
+                if is_complete or self._is_at_end:
+                    self._pos = end
+                    return value
+            self._read_more()
+    def _read_more(self):
+        # Appends the next chunk to the text. Returns False if there is none.
+        if self._is_at_end:
+            return False
+        chunk = next(self._chunks, None)
+        # Drop what was already parsed.
+        self._text = self._text[self._pos:]
+        self._pos = 0
+        if chunk is None:
+            self._is_at_end = True
+            self._text += self._decode(b'', final=True)
+        else:
+            self._text += self._decode(chunk)
+        return True
+
+_DECODER = JSONDecoder()
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+_DELIMITERS = ' \t\n\r,]}'
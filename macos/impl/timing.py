@@ -0,0 +1,121 @@
+from functools import wraps
+from os import makedirs
+from os.path import dirname
+from threading import Lock, local
+from time import perf_counter, time
+from uuid import uuid4
+
+import json
+import platform
+import sys
+
+# Records how long the phases of an action take, such as fetching releases,
+# downloading an installer or copying the app. Each phase is a span:
+#
+#     with timing.span('download', url=url) as record:
+#         ...
+#         record['bytes'] += num_bytes
+#
+# When the span ends, its wall time and, if it set 'bytes', its throughput are
+# added to the record. Spans can be nested and may run in any thread. Recording
+# them is cheap, so they are always on. `bm --profile` prints a summary of them
+# when it is done, and each run appends them to config.TIMING_LOG.
+
+def span(name, **attributes):
+    return _Span(name, attributes)
+
+def timed(name):
+    # Decorator that records each call of a function as a span.
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_records():
+    # Returns the records of the spans that have ended so far, in the order in
+    # which they started.
+    with _lock:
+        return sorted(_records, key=lambda record: record['start'])
+
+def print_summary(file=None):
+    # Printed to stderr by default, so it doesn't get mixed up with the JSON
+    # that the command line interface prints to stdout.
+    from impl.util import human_readable_size
+    file = file or sys.stderr
+    print(f'{"Time":>9}  {"Bytes":>9}  {"Speed":>11}  Phase', file=file)
+    for record in get_records():
+        num_bytes = speed = ''
+        if 'bytes' in record:
+            num_bytes = human_readable_size(record['bytes'])
+        if 'bytes_per_second' in record:
+            speed = human_readable_size(record['bytes_per_second']) + '/s'
+        name = '  ' * record['depth'] + record['name']
+        if 'error' in record:
+            name += f' (failed: {record["error"]})'
+        print(
+            f'{record["duration"]:8.3f}s  {num_bytes:>9}  {speed:>11}  {name}',
+            file=file
+        )
+
+def write_log(path):
+    # Appends the records as JSON lines to the file at `path`. The lines of
+    # one run share a session ID. Does nothing if `path` is empty.
+    records = get_records()
+    if not path or not records:
+        return
+    common = {'session': _SESSION, 'host': platform.node()}
+    lines = ''.join(
+        json.dumps({**common, **record}) + '\n' for record in records
+    )
+    makedirs(dirname(path), exist_ok=True)
+    # Write all lines at once, so they don't get interleaved with those of
+    # other runs that end at the same time.
+    with open(path, 'a') as f:
+        f.write(lines)
+
+def clear():
+    with _lock:
+        _records.clear()
+
+class _Span:
+    def __init__(self, name, attributes):
+        self._record = {'name': name, **attributes}
+        self._start = None
+    def __enter__(self):
+        stack = _get_stack()
+        self._record['depth'] = len(stack)
+        self._record['start'] = time()
+        stack.append(self)
+        self._start = perf_counter()
+        return self._record
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = perf_counter() - self._start
+        # A generator may be closed in another thread than it was started in.
+        stack = _get_stack()
+        if self in stack:
+            stack.remove(self)
+        record = self._record
+        record['duration'] = duration
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if 'bytes' in record and duration > 0:
+            record['bytes_per_second'] = record['bytes'] / duration
+        with _lock:
+            _records.append(record)
+
+def _get_stack():
+    # The spans that are running in the current thread.
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+_SESSION = uuid4().hex
+
+_records = []
+_lock = Lock()
+_local = local()
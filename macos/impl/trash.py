@@ -0,0 +1,62 @@
+from os import listdir, makedirs, rename, rmdir
+from os.path import basename, dirname, isdir, join
+from subprocess import Popen, DEVNULL
+from uuid import uuid4
+
+from impl.tree import remove_tree
+
+import sys
+
+# Deleting a large directory, such as a profile with hundreds of thousands of
+# files, takes minutes. Instead, we rename it into a trash directory next to
+# it. This is instant, because the trash directory is on the same volume. A
+# background process then deletes the contents of the trash directory. If it
+# does not get to finish, then it is resumed the next time we are launched.
+TRASH_DIR_NAME = '.brave-manager-trash'
+
+def get_trash_dir(path):
+    return join(dirname(path), TRASH_DIR_NAME)
+
+def move_to_trash(path):
+    # Moves the file or directory at `path` into the trash and returns the
+    # trash directory. Raises FileNotFoundError if there is nothing at `path`.
+    trash_dir = get_trash_dir(path)
+    makedirs(trash_dir, exist_ok=True)
+    # Several files with the same name can be in the trash at the same time.
+    rename(path, join(trash_dir, f'{basename(path)}.{uuid4().hex}'))
+    return trash_dir
+
+def empty_in_background(trash_dirs):
+    # Starts a process that empties the given trash directories and then
+    # removes them. It keeps running after we exit. Returns the process, or
+    # None if there is nothing to delete.
+    trash_dirs = sorted(set(filter(isdir, trash_dirs)))
+    if not trash_dirs:
+        return None
+    return Popen(
+        [sys.executable, '-m', 'impl.trash', *trash_dirs],
+        cwd=dirname(dirname(__file__)), stdin=DEVNULL, stdout=DEVNULL,
+        stderr=DEVNULL, start_new_session=True
+    )
+
+def empty(trash_dir):
+    try:
+        names = listdir(trash_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        # Another process may be emptying the same trash directory. Or we may
+        # lack the permissions, eg. for the system-wide Brave Updater. Then
+        # it is deleted by a later process with sufficient permissions.
+        try:
+            remove_tree(join(trash_dir, name))
+        except OSError:
+            pass
+    try:
+        rmdir(trash_dir)
+    except OSError:
+        pass
+
+if __name__ == '__main__':
+    for trash_dir in sys.argv[1:]:
+        empty(trash_dir)
@@ -0,0 +1,342 @@
+from concurrent.futures import ThreadPoolExecutor
+from os import chmod, lstat, mkdir, readlink, rmdir, scandir, symlink, unlink
+from os.path import basename, isdir, islink, join
+from shutil import copyfile, copystat
+from stat import S_IREAD, S_IWRITE
+from threading import Event, Lock
+
+import ctypes
+import ctypes.util
+import os
+import sys
+
+# This module is also used by windows/uninstall_brave.py. So it must not import
+# anything that only works on macOS.
+
+# Removing or copying a file takes system calls whose latency, rather than
+# the throughput of the disk, limits how fast a large directory tree can be
+# processed. We therefore process many files in parallel.
+NUM_WORKERS = 16
+
+# How many files of a directory one task processes:
+_BATCH_SIZE = 256
+
+# How often remove_tree(...) and copy_tree(...) call `on_progress`, in seconds:
+_PROGRESS_INTERVAL = 0.1
+
+def remove_tree(path, on_progress=None, num_workers=NUM_WORKERS):
+    # Like shutil.rmtree(path), but many times faster for large trees. Errors
+    # don't abort the removal. Instead, everything else is removed and then a
+    # TreeError is raised that lists all errors. `on_progress` is called
+    # periodically in the calling thread with the number of files and bytes
+    # removed so far.
+    # Raises FileNotFoundError if there is nothing at `path`, just like
+    # shutil.rmtree(...).
+    stat_result = lstat(path)
+    if islink(path) or _is_junction(stat_result) or not isdir(path):
+        _remove_entry(path, stat_result)
+        if on_progress:
+            on_progress(1, stat_result.st_size)
+        return
+    _TreeRemover(num_workers).run(_Dir(path), on_progress)
+
+def copy_tree(src, dst, on_progress=None, num_workers=NUM_WORKERS):
+    # Like shutil.copytree(src, dst, symlinks=True), but many times faster
+    # for large trees. Also copies extended attributes on macOS. Where the
+    # file system supports it, files are cloned instead of copied. `dst` must
+    # not exist yet. Errors are handled like in remove_tree(...).
+    # Raises FileNotFoundError if there is nothing at `src`.
+    lstat(src)
+    if _clone_tree(src, dst):
+        return
+    _TreeCopier(num_workers).run(_Dir(src, dst=dst), on_progress)
+
+class TreeError(OSError):
+    def __init__(self, path, errors):
+        # `errors` is a list of (path, exception) pairs.
+        self.path = path
+        self.errors = errors
+        first_path, first_error = errors[0]
+        super().__init__(
+            f'{len(errors)} error(s) in {path}. The first was for '
+            f'{first_path}: {first_error}'
+        )
+
+class _TreeWalker:
+
+    # Processes a directory tree with many threads. Each directory is scanned
+    # in its own task. Its other entries are processed in batches in further
+    # tasks, with process_entry(directory, entry). It returns the number of
+    # bytes processed, or None if there was nothing to process. Once all tasks
+    # for a directory are done, then the directory is finished, and then its
+    # parent once all of its tasks are done.
+
+    def __init__(self, num_workers, process_entry):
+        self.num_files = 0
+        self.num_bytes = 0
+        self.errors = []
+        self._is_done = Event()
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(num_workers)
+        self._process_entry = process_entry
+
+    def run(self, root, on_progress=None):
+        self._submit(self._scan, root)
+        while not self._is_done.wait(_PROGRESS_INTERVAL):
+            if on_progress:
+                on_progress(self.num_files, self.num_bytes)
+        self._executor.shutdown(wait=False)
+        if on_progress:
+            on_progress(self.num_files, self.num_bytes)
+        if self.errors:
+            raise TreeError(root.path, self.errors)
+
+    def _enter_dir(self, directory):
+        # Called before the directory is scanned.
+        pass
+
+    def _finish_dir(self, directory):
+        # Called when all entries of the directory were processed.
+        pass
+
+    def _scan(self, directory):
+        entries = []
+        try:
+            self._enter_dir(directory)
+            with scandir(directory.path) as dir_entries:
+                for entry in dir_entries:
+                    if entry.is_dir(follow_symlinks=False) \
+                            and not _is_junction(entry):
+                        child = _Dir(entry.path, directory)
+                        self._add_pending(directory)
+                        self._submit(self._scan, child)
+                    else:
+                        entries.append(entry)
+                        if len(entries) == _BATCH_SIZE:
+                            self._submit_entries(directory, entries)
+                            entries = []
+        except FileNotFoundError:
+            # Someone else removed the directory.
+            pass
+        except OSError as e:
+            self._add_error(directory, directory.path, e)
+        if entries:
+            self._submit_entries(directory, entries)
+        self._finish(directory)
+
+    def _submit_entries(self, directory, entries):
+        self._add_pending(directory)
+        self._submit(self._process_entries_task, directory, entries)
+
+    def _process_entries_task(self, directory, entries):
+        # Processes the files and links in a directory.
+        num_files = num_bytes = 0
+        for entry in entries:
+            try:
+                size = self._process_entry(directory, entry)
+            except OSError as e:
+                self._add_error(directory, entry.path, e)
+                continue
+            if size is not None:
+                num_files += 1
+                num_bytes += size
+        with self._lock:
+            self.num_files += num_files
+            self.num_bytes += num_bytes
+        self._finish(directory)
+
+    def _submit(self, fn, *args):
+        def run():
+            try:
+                fn(*args)
+            except BaseException:
+                # A bug. Don't leave run(...) waiting forever.
+                self._is_done.set()
+                raise
+        self._executor.submit(run)
+
+    def _add_pending(self, directory):
+        with self._lock:
+            directory.num_pending += 1
+
+    def _add_error(self, directory, path, error):
+        with self._lock:
+            self.errors.append((path, error))
+            directory.has_errors = True
+
+    def _finish(self, directory):
+        # Called when a task for `directory` is done.
+        while directory is not None:
+            with self._lock:
+                directory.num_pending -= 1
+                if directory.num_pending:
+                    return
+            self._finish_dir(directory)
+            parent = directory.parent
+            if parent is not None and directory.has_errors:
+                with self._lock:
+                    parent.has_errors = True
+            directory = parent
+        self._is_done.set()
+
+class _TreeRemover(_TreeWalker):
+
+    def __init__(self, num_workers):
+        super().__init__(num_workers, self._remove_entry)
+
+    def _remove_entry(self, directory, entry):
+        try:
+            stat_result = entry.stat(follow_symlinks=False)
+            _remove_entry(entry.path, stat_result)
+        except FileNotFoundError:
+            return None
+        return stat_result.st_size
+
+    def _finish_dir(self, directory):
+        # If something in the directory could not be removed, then it is not
+        # empty, and that error is enough.
+        if directory.has_errors:
+            return
+        try:
+            rmdir(directory.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self._add_error(directory, directory.path, e)
+
+class _TreeCopier(_TreeWalker):
+
+    def __init__(self, num_workers):
+        super().__init__(num_workers, self._copy_entry)
+
+    def _enter_dir(self, directory):
+        if directory.dst is None:
+            directory.dst = join(directory.parent.dst, basename(directory.path))
+        mkdir(directory.dst)
+        directory.is_copied = True
+
+    def _copy_entry(self, directory, entry):
+        dst = join(directory.dst, entry.name)
+        if entry.is_symlink():
+            symlink(readlink(entry.path), dst)
+            return 0
+        _copy_file(entry.path, dst)
+        return entry.stat(follow_symlinks=False).st_size
+
+    def _finish_dir(self, directory):
+        if not directory.is_copied:
+            return
+        # Only now, because the directory may not be writable.
+        try:
+            _copy_metadata(directory.path, directory.dst)
+        except OSError as e:
+            self._add_error(directory, directory.path, e)
+
+class _Dir:
+    def __init__(self, path, parent=None, dst=None):
+        self.path = path
+        self.parent = parent
+        # Where _TreeCopier copies the directory to, and whether it created it:
+        self.dst = dst
+        self.is_copied = False
+        # The number of tasks for this directory that are not done yet. The
+        # task that scans the directory counts, too.
+        self.num_pending = 1
+        self.has_errors = False
+
+def _is_junction(entry_or_stat_result):
+    # Windows junctions are directories to os.path.isdir(...) and
+    # DirEntry.is_dir(follow_symlinks=False). But like symlinks, they point
+    # to another directory, whose contents we must not touch. So we remove
+    # them without recursing into them, like shutil.rmtree(...).
+    # DirEntry.is_junction() only exists as of Python 3.12.
+    if os.name != 'nt':
+        return False
+    stat_result = entry_or_stat_result
+    if isinstance(stat_result, os.DirEntry):
+        stat_result = stat_result.stat(follow_symlinks=False)
+    return stat_result.st_reparse_tag == _IO_REPARSE_TAG_MOUNT_POINT
+
+# From winnt.h. Python's stat module only defines it on Windows.
+_IO_REPARSE_TAG_MOUNT_POINT = 0xA0000003
+
+def _remove_entry(path, stat_result):
+    # Removes a file, symlink or junction.
+    if _is_junction(stat_result):
+        rmdir(path)
+    else:
+        _unlink(path)
+
+def _unlink(path):
+    try:
+        unlink(path)
+    except PermissionError:
+        # Windows does not let us delete read-only files.
+        if os.name != 'nt':
+            raise
+        chmod(path, S_IREAD | S_IWRITE)
+        unlink(path)
+
+if sys.platform == 'darwin':
+    # shutil does not copy extended attributes on macOS. So we use the
+    # system's copyfile(3). With COPYFILE_CLONE, it clones files on APFS and
+    # otherwise copies them.
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _COPYFILE_ACL = 1 << 0
+    _COPYFILE_STAT = 1 << 1
+    _COPYFILE_XATTR = 1 << 2
+    _COPYFILE_DATA = 1 << 3
+    _COPYFILE_METADATA = _COPYFILE_ACL | _COPYFILE_STAT | _COPYFILE_XATTR
+    _COPYFILE_CLONE = 1 << 24
+
+    def _copyfile(src, dst, flags):
+        result = _libc.copyfile(
+            os.fsencode(src), os.fsencode(dst), None, flags
+        )
+        if result != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), src)
+
+    def _copy_file(src, dst):
+        flags = _COPYFILE_METADATA | _COPYFILE_DATA | _COPYFILE_CLONE
+        _copyfile(src, dst, flags)
+
+    def _copy_metadata(src, dst):
+        _copyfile(src, dst, _COPYFILE_METADATA)
+
+    def _clone_tree(src, dst):
+        # clonefile(2) clones a whole directory tree at once. But only within
+        # the same APFS volume.
+        result = _libc.clonefile(os.fsencode(src), os.fsencode(dst), 0)
+        return result == 0
+else:
+    try:
+        import fcntl
+    except ImportError:
+        # We are on Windows.
+        fcntl = None
+
+    # From linux/fs.h. Clones a file on eg. Btrfs and XFS.
+    _FICLONE = 0x40049409
+
+    def _copy_file(src, dst):
+        if not _clone_file(src, dst):
+            copyfile(src, dst, follow_symlinks=False)
+        # Also copies extended attributes on Linux.
+        copystat(src, dst, follow_symlinks=False)
+
+    def _clone_file(src, dst):
+        if fcntl is None or sys.platform != 'linux':
+            return False
+        with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+            try:
+                fcntl.ioctl(f_dst.fileno(), _FICLONE, f_src.fileno())
+            except OSError:
+                return False
+        return True
+
+    def _copy_metadata(src, dst):
+        copystat(src, dst, follow_symlinks=False)
+
+    def _clone_tree(src, dst):
+        return False
@@ -1,5 +1,5 @@
+from impl import timing, trash
 from os.path import expanduser, exists
-from shutil import rmtree
 from subprocess import run
 
 _UPDATER_PATH = '/Library/Application Support/BraveSoftware/BraveUpdater'
@@ -16,6 +16,7 @@ def get_installed_updaters():
         if exists(path)
     ]
 
+@timing.timed('updater.uninstall')
 def uninstall(scope):
     updater_path = UPDATER_PATHS[scope]
     updater_executable = updater_path + UPDATER_EXECUTABLE
@@ -24,4 +25,8 @@ def uninstall(scope):
         if scope == 'system':
             args.append('--system')
         run(args, check=True)
-    rmtree(updater_path)
+    trash_dir = trash.move_to_trash(updater_path)
+    trash.empty_in_background([trash_dir])
+
+def get_trash_dirs():
+    return {trash.get_trash_dir(path) for path in UPDATER_PATHS.values()}
@@ -1,12 +1,12 @@
 from contextlib import contextmanager
-from os import getpid, listdir
-from os.path import join
-from shutil import copytree
+from impl import timing, trash
+from impl.tree import copy_tree, remove_tree
+from os import getpid, listdir, rename
+from os.path import exists, join
 from subprocess import run, DEVNULL
 from time import time
+from uuid import uuid4
 
-import questionary
-import requests
 import re
 import sys
 
@@ -19,6 +19,9 @@ def extract_version(tag_name):
     return match.group(1)
 
 def select(message, choices, instruction=' '):
+    # Imported here because it takes long, and non-interactive commands don't
+    # need it.
+    import questionary
     use_shortcuts = \
         len(choices) <= MAX_NUM_CHOICES_SUPPORTED_BY_QUESTIONARY_SELECT
     question = questionary.select(
@@ -26,30 +29,40 @@ def select(message, choices, instruction=' '):
     )
     return question.ask()
 
-class FileDownloader:
-    def __init__(self, url, path):
-        self.url = url
-        self.path = path
-        self.response = None
-    def start(self):
-        self.response = requests.get(self.url, stream=True)
-        return int(self.response.headers.get('content-length', 0))
-    def run(self, block_size=1024):
-        with open(self.path, 'wb') as f:
-            for data in self.response.iter_content(block_size):
-                f.write(data)
-                yield len(data)
-
+@timing.timed('install_dmg')
 def install_dmg(dmg_path):
     mount_point = f'/Volumes/temp_{getpid()}_{int(time())}'
-    _run('hdiutil', 'attach', dmg_path, '-nobrowse', '-mountpoint', mount_point)
+    with timing.span('hdiutil attach'):
+        _run(
+            'hdiutil', 'attach', dmg_path, '-nobrowse', '-mountpoint',
+            mount_point
+        )
     try:
         app_name = [f for f in listdir(mount_point) if f.endswith('.app')][0]
         src_path = join(mount_point, app_name)
         dst_path = join('/Applications', app_name)
-        copytree(src_path, dst_path, symlinks=True)
+        # Copy to a hidden directory next to the destination first. Then a
+        # half-copied app never appears in /Applications.
+        staging_path = join('/Applications', f'.{app_name}.{uuid4().hex}')
+        try:
+            # Cloning the whole tree at once does not report any progress,
+            # and so no bytes.
+            with timing.span('copy_tree') as record:
+                def on_progress(num_files, num_bytes):
+                    record.update(files=num_files, bytes=num_bytes)
+                copy_tree(src_path, staging_path, on_progress)
+            if exists(dst_path):
+                trash.empty_in_background([trash.move_to_trash(dst_path)])
+            rename(staging_path, dst_path)
+        except BaseException:
+            try:
+                remove_tree(staging_path)
+            except OSError:
+                pass
+            raise
     finally:
-        _run('hdiutil', 'detach', mount_point)
+        with timing.span('hdiutil detach'):
+            _run('hdiutil', 'detach', mount_point)
 
 def install_pkg(pkg_path):
     _run('installer', '-pkg', pkg_path, '-target', '/')
@@ -58,7 +71,8 @@ def install_pkg(pkg_path):
 def print_done(message):
     sys.stdout.write(f'{message}...')
     sys.stdout.flush()
-    yield
+    with timing.span(message):
+        yield
     sys.stdout.write(' done.\n')
 
 def human_readable_size(size_bytes):
@@ -1,15 +1,18 @@
-from impl import brave, cache, CHANNELS, updater
+from impl import brave, cache, config, timing, trash, CHANNELS, updater
 from impl.actions import Uninstall, Install, Launch, ClearCache, \
-    UninstallUpdater, DeleteProfile
+    UninstallUpdater, DeleteProfile, PruneCache, run_actions
 from impl.cache import CACHE_DIR
-from impl.releases import get_releases, group_by_minor_version
+from impl.releases import get_releases, group_by_minor_version, \
+    start_background_refresh
 from impl.util import select, human_readable_size
 from os.path import expanduser
 
 import re
+import sys
 
 def main():
     try:
+        start_background_refresh()
         actions = []
         main_action = ask_main_action()
         profiles = brave.get_existing_profiles()
@@ -56,11 +59,17 @@ def main():
             if not to_uninstall:
                 return
             actions.append(UninstallUpdater(to_uninstall))
+        elif main_action == 'prune_cache':
+            files_to_prune = cache.get_files_to_prune()
+            if not files_to_prune:
+                max_size = human_readable_size(config.CACHE_MAX_SIZE)
+                print(f'The cache is already smaller than {max_size}.')
+                return
+            actions.append(PruneCache(files_to_prune))
         elif main_action == 'clear_cache':
             actions.append(ClearCache())
         if ask_confirm_actions(actions):
-            for action in actions:
-                action()
+            run_actions(actions)
     except KeyboardInterrupt:
         pass
 
@@ -69,12 +78,17 @@ def ask_main_action():
     instruction = '(press ctrl+c to cancel)'
     cache_size_text = human_readable_size(cache.get_size())
     cache_dir = CACHE_DIR.replace(expanduser('~'), '~')
+    max_size_text = human_readable_size(config.CACHE_MAX_SIZE)
+    size_to_prune = sum(size for _, size in cache.get_files_to_prune())
+    size_to_prune_text = human_readable_size(size_to_prune)
     choices = {
         'Install a new version of Brave': 'install',
         'Uninstall Brave': 'uninstall',
         'Delete a profile': 'delete_profile',
         'Launch Brave': 'launch',
         'Uninstall Brave Updater': 'uninstall_updater',
+        f'Prune the cache to {max_size_text} '
+        f'(frees {size_to_prune_text})': 'prune_cache',
         f'Clear the cache ({cache_size_text} in {cache_dir})': 'clear_cache'
     }
     choice_text = select(message, choices, instruction)
@@ -118,11 +132,12 @@ def ask_public_only():
     return choice == 'yes'
 
 def ask_dmg_to_install(channel, public_only):
-    releases = get_releases(channel, public_only)
-    minor_releases = group_by_minor_version(releases)
     while True:
+        # Releases from the background refresh show up once they arrive.
+        releases = get_releases(channel, public_only)
+        minor_releases = group_by_minor_version(releases)
         message = 'Which release do you want to install?'
-        minor_version = select(message, sort_minor_versions(minor_releases))
+        minor_version = select(message, list(minor_releases))
         if minor_version is None:
             raise KeyboardInterrupt
 
@@ -131,7 +146,7 @@ def ask_dmg_to_install(channel, public_only):
             _get_release_title(r, channel): r
             for r in minor_releases[minor_version]
         }
-        release_title = select(message, sort_versions(releases))
+        release_title = select(message, list(releases))
         if release_title is None:
             continue
 
@@ -182,15 +197,6 @@ def ask_confirm_actions(actions):
     choice = select(message, choices)
     return choice == choices[0]
 
-def sort_minor_versions(versions):
-    parse_minor_version = lambda v: tuple(map(int, v.split('.')[:2]))
-    return sorted(versions, key=parse_minor_version, reverse=True)
-
-def sort_versions(releases):
-    parse_version = lambda v: tuple(map(int, v.split('.')))
-    get_version_tuple = lambda v: parse_version(releases[v]['version'])
-    return sorted(releases, key=get_version_tuple, reverse=True)
-
 def _get_release_title(r, channel):
     result = r['name'].replace(f'{channel.title()} ', '')
     result = re.sub(r'^v', '', result)
@@ -199,4 +205,26 @@ def _get_release_title(r, channel):
     return result
 
 if __name__ == "__main__":
-    main()
+    # Finish deleting what earlier runs moved to the trash.
+    trash.empty_in_background(brave.get_trash_dirs() | updater.get_trash_dirs())
+    args = sys.argv[1:]
+    # --profile prints how long each phase took. It works for the interactive
+    # menu as well as for the commands in impl/cli.py.
+    profile = '--profile' in args
+    if profile:
+        args.remove('--profile')
+    exit_code = 0
+    try:
+        if args:
+            from impl import cli
+            exit_code = cli.main(args)
+        else:
+            main()
+    finally:
+        try:
+            timing.write_log(config.TIMING_LOG)
+        except OSError:
+            pass
+        if profile:
+            timing.print_summary()
+    sys.exit(exit_code)
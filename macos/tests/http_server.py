@@ -0,0 +1,35 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+# A local HTTP server for tests and benchmarks. Each supplies the logic of its
+# server as a subclass of Handler:
+#
+#     class MyHandler(Handler):
+#         def do_GET(self):
+#             self.send_body(200, b'...')
+#     server = start_server(MyHandler)
+#     self.addCleanup(stop_server, server)
+#     net.get(server.url + '/path')
+
+class Handler(BaseHTTPRequestHandler):
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    def log_message(self, *args):
+        # Keep the output of tests clean.
+        pass
+
+def start_server(handler_class):
+    # Serves on a free port of the loopback interface, in the background.
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
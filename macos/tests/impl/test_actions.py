@@ -0,0 +1,140 @@
+from contextlib import redirect_stdout, redirect_stderr
+from hashlib import sha256
+from impl import cache
+from impl.actions import run_actions, download_to_cache, DownloadProgress, \
+    DownloadCancelled, Prefetch
+from io import StringIO
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Event, Thread, Timer
+from time import sleep
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+class RunActionsTest(TestCase):
+    def test_preparation_overlaps_with_earlier_actions(self):
+        log = []
+        uninstalling = Event()
+        def uninstall():
+            uninstalling.set()
+            log.append('uninstall')
+        def download():
+            # Would time out if we only started after uninstall().
+            self.assertTrue(uninstalling.wait(timeout=5))
+            log.append('download')
+        install = _PreparedAction(download, lambda: log.append('install'))
+        run_actions([_Action(uninstall), install])
+        self.assertEqual(['uninstall', 'download', 'install'], log)
+    def test_preparation_is_cancelled_when_an_action_fails(self):
+        def fail():
+            raise OSError()
+        install = _PreparedAction(lambda: None, lambda: None)
+        with self.assertRaises(OSError):
+            run_actions([_Action(fail), install])
+        self.assertTrue(install.cancelled)
+    def test_on_done(self):
+        actions = [_Action(lambda: None), _Action(lambda: None)]
+        done = []
+        run_actions(actions, done.append)
+        self.assertEqual(actions, done)
+
+class DownloadProgressTest(TestCase):
+    def test_hidden_until_shown(self):
+        output = StringIO()
+        with redirect_stdout(output), redirect_stderr(output):
+            progress = DownloadProgress('https://example.com/a.dmg')
+            progress.start(100, 10)
+            progress.update(40)
+            self.assertEqual('', output.getvalue())
+            progress.show()
+            progress.update(50)
+            progress.close()
+        output_text = output.getvalue()
+        self.assertIn('Downloading https://example.com/a.dmg', output_text)
+        self.assertIn('100/100', output_text)
+
+class PrefetchTest(TestCase):
+    def test_results(self):
+        def download_to_cache(url, *args):
+            if url.endswith('broken.dmg'):
+                raise OSError('broken')
+            return url, url.endswith('new.dmg')
+        urls = [
+            'https://a/cached.dmg', 'https://a/new.dmg', 'https://a/broken.dmg'
+        ]
+        prefetch = Prefetch(urls, num_downloads=2, max_bandwidth=0)
+        with patch('impl.actions.download_to_cache', download_to_cache), \
+                redirect_stdout(StringIO()):
+            with self.assertRaises(RuntimeError):
+                prefetch()
+        self.assertEqual({
+            'https://a/cached.dmg': 'cached',
+            'https://a/new.dmg': 'downloaded',
+            'https://a/broken.dmg': 'broken'
+        }, prefetch.results)
+
+class DownloadToCacheTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = patch.object(
+            cache, 'CACHE_DIR', join(tmp_dir.name, '.cache')
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    def test_concurrent_downloads_of_the_same_installer(self):
+        # Eg. `bm prefetch` via cron, and `bm install` at the same time.
+        downloads = []
+        def download_file(url, path, *args):
+            downloads.append(url)
+            sleep(0.1)
+            with open(path, 'wb') as f:
+                f.write(b'installer')
+            return Mock(get_sha256=lambda: sha256(b'installer').hexdigest())
+        url = 'https://github.com/v1.2.3/Brave.dmg'
+        results = []
+        def download():
+            results.append(download_to_cache(url, DownloadProgress(url))[1])
+        threads = [Thread(target=download) for _ in range(2)]
+        with patch('impl.actions.download_file', download_file):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([url], downloads)
+        self.assertEqual([False, True], sorted(results))
+    def test_cancel_while_another_process_downloads(self):
+        url = 'https://github.com/v1.2.3/Brave.dmg'
+        progress = DownloadProgress(url)
+        progress.show()
+        cancelled = Event()
+        download_file = Mock()
+        stdout = StringIO()
+        with cache.lock('github.com/v1.2.3/Brave.dmg'), \
+                patch('impl.actions.download_file', download_file), \
+                redirect_stdout(stdout):
+            Timer(0.2, cancelled.set).start()
+            with self.assertRaises(DownloadCancelled):
+                download_to_cache(url, progress, cancelled)
+        download_file.assert_not_called()
+        self.assertIn('Waiting for another process', stdout.getvalue())
+
+class _Action:
+    def __init__(self, fn):
+        self.fn = fn
+    def __call__(self):
+        self.fn()
+
+class _PreparedAction(_Action):
+    def __init__(self, prepare, fn):
+        super().__init__(fn)
+        self.prepare = prepare
+        self.preparation = None
+        self.cancelled = False
+    def start_preparing(self, executor):
+        self.preparation = executor.submit(self.prepare)
+    def cancel_preparation(self):
+        self.cancelled = True
+    def __call__(self):
+        self.preparation.result()
+        super().__call__()
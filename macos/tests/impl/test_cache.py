@@ -0,0 +1,121 @@
+from hashlib import sha256
+from impl import cache
+from os import remove, replace, walk
+from os.path import exists, getsize, join
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+class CacheTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = patch.object(
+            cache, 'CACHE_DIR', join(tmp_dir.name, '.cache')
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    def test_verify_unknown_file(self):
+        path = self._write('a/installer.dmg', b'installer')
+        self.assertFalse(cache.verify('a/installer.dmg'))
+        self.assertFalse(exists(path))
+    def test_verify_intact_file(self):
+        self._add('a/installer.dmg', b'installer')
+        self.assertTrue(cache.verify('a/installer.dmg'))
+    def test_verify_truncated_file(self):
+        path = self._add('a/installer.dmg', b'installer')
+        self._write('a/installer.dmg', b'inst')
+        self.assertFalse(cache.verify('a/installer.dmg'))
+        self.assertFalse(exists(path))
+    def test_verify_corrupt_file(self):
+        self._add('a/installer.dmg', b'installer')
+        self._write('a/installer.dmg', b'installed')
+        self.assertFalse(cache.verify('a/installer.dmg'))
+        self._write('a/installer.dmg', b'installer')
+        # The entry was evicted along with the file:
+        self.assertFalse(cache.verify('a/installer.dmg'))
+    def test_prune_evicts_least_recently_used(self):
+        with patch('impl.cache.time', side_effect=range(100)):
+            self._add('v1/old.dmg', b'1' * 100)
+            self._add('v2/new.dmg', b'2' * 100)
+            self._add('v3/newest.dmg', b'3' * 100)
+            cache.verify('v1/old.dmg')
+        self._write('releases.json', b'0' * 100)
+        # The first call brings the size index up to date:
+        cache.get_size()
+        max_size = cache.get_size() - 150
+        expected = [('v2/new.dmg', 100), ('v3/newest.dmg', 100)]
+        self.assertEqual(expected, cache.get_files_to_prune(max_size))
+        self.assertEqual(200, cache.prune(max_size))
+        self.assertTrue(cache.verify('v1/old.dmg'))
+        self.assertTrue(exists(join(cache.CACHE_DIR, 'releases.json')))
+        self.assertFalse(exists(join(cache.CACHE_DIR, 'v2')))
+    def test_prune_keeps_files(self):
+        self._add('v1/a.dmg', b'1' * 100)
+        self._add('v2/b.dmg', b'2' * 100)
+        cache.prune(max_size=0, keep=['v2/b.dmg'])
+        self.assertFalse(exists(join(cache.CACHE_DIR, 'v1', 'a.dmg')))
+        self.assertTrue(cache.verify('v2/b.dmg'))
+    def test_prune_keeps_downloads_in_progress(self):
+        self._add('v1/a.dmg', b'1' * 100)
+        self._write('v2/b.dmg.part', b'2' * 100)
+        self._write('v2/b.dmg.part.json', b'{}')
+        self.assertEqual(
+            [('v1/a.dmg', 100)], cache.get_files_to_prune(max_size=0)
+        )
+    def test_nothing_to_prune(self):
+        self._add('v1/a.dmg', b'1' * 100)
+        self.assertEqual([], cache.get_files_to_prune(max_size=10 ** 6))
+    def test_size_index_is_updated(self):
+        self._add('v1/a.dmg', b'1' * 100)
+        size_before = cache.get_size()
+        self._add('v2/b.dmg', b'2' * 100)
+        with patch('os.walk') as walk:
+            self.assertGreater(cache.get_size(), size_before + 100 - 1)
+        walk.assert_not_called()
+    def test_size_index_detects_external_changes(self):
+        self._add('v1/a.dmg', b'1' * 100)
+        size_before = cache.get_size()
+        self._write('v2/b.dmg', b'2' * 1000)
+        self.assertGreater(cache.get_size(), size_before + 1000 - 1)
+    def test_size_index_after_resumed_download(self):
+        self._add('v1/a.dmg', b'1' * 100)
+        # A download of v2/b.dmg is interrupted:
+        self._write('v2/b.dmg.part', b'2' * 1000)
+        self._write('v2/b.dmg.part.json', b'{}')
+        cache.get_size()
+        # It is resumed and completes:
+        path = cache.prepare('v2/b.dmg')
+        replace(path + '.part', path)
+        remove(path + '.part.json')
+        sha256_hex = sha256(b'2' * 1000).hexdigest()
+        cache.add('v2/b.dmg', 'https://v2/b.dmg', 1000, sha256_hex)
+        self.assertEqual(self._get_actual_size(), cache.get_size())
+    def test_concurrent_adds_are_not_lost(self):
+        threads = [
+            Thread(target=self._add, args=(f'v{i}/a.dmg', b'a'))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(8):
+            self.assertTrue(cache.verify(f'v{i}/a.dmg'))
+    def _get_actual_size(self):
+        return sum(
+            getsize(join(dir_path, file_name))
+            for dir_path, _, file_names in walk(cache.CACHE_DIR)
+            for file_name in file_names
+        )
+    def _add(self, path_in_cache, data):
+        path = self._write(path_in_cache, data)
+        url = 'https://' + path_in_cache
+        cache.add(path_in_cache, url, len(data), sha256(data).hexdigest())
+        return path
+    def _write(self, path_in_cache, data):
+        path = cache.prepare(path_in_cache)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
@@ -0,0 +1,145 @@
+from contextlib import redirect_stderr, redirect_stdout
+from impl import cli
+from impl.actions import Uninstall, Install, Launch, DeleteProfile, \
+    Prefetch
+from impl.cli import CliError, select_installer, select_release
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import json
+
+class SelectReleaseTest(TestCase):
+    def setUp(self):
+        self.releases = [
+            _release('1.71.5'), _release('1.70.9'), _release('1.70.8')
+        ]
+    def test_latest(self):
+        self.assertEqual('1.71.5', select_release(self.releases)['version'])
+    def test_latest_in_minor_version(self):
+        release = select_release(self.releases, '1.70.x')
+        self.assertEqual('1.70.9', release['version'])
+    def test_exact_version(self):
+        release = select_release(self.releases, '1.70.8')
+        self.assertEqual('1.70.8', release['version'])
+    def test_unknown_version(self):
+        with self.assertRaises(CliError):
+            select_release(self.releases, '1.69.x')
+
+class SelectInstallerTest(TestCase):
+    def test_part_of_name(self):
+        release = _release('1.70.9')
+        self.assertEqual(
+            'Brave-Browser-arm64.dmg', select_installer(release, 'arm64')
+        )
+    def test_dmg_is_preferred(self):
+        release = _release('1.70.9')
+        self.assertEqual(
+            'Brave-Browser-universal.dmg',
+            select_installer(release, 'universal')
+        )
+    def test_universal_dmg_by_default(self):
+        self.assertEqual(
+            'Brave-Browser-universal.dmg', select_installer(_release('1.70.9'))
+        )
+    def test_ambiguous(self):
+        release = _release('1.70.9')
+        release['installers'] = {
+            name: f'https://example.com/{name}'
+            for name in ('Brave-Browser-arm64.dmg', 'Brave-Browser-x64.dmg')
+        }
+        with self.assertRaises(CliError):
+            select_installer(release)
+
+class MainTest(TestCase):
+    def setUp(self):
+        self.calls = []
+        for action_class in (
+            Uninstall, Install, Launch, DeleteProfile, Prefetch
+        ):
+            patcher = patch.object(
+                action_class, '__call__', self._record_call(action_class)
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(Install, 'start_preparing')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, value in (
+            ('get_installed_channels', {'nightly': '1.70.8'}),
+            ('get_existing_profiles', ['nightly'])
+        ):
+            patcher = patch(f'impl.brave.{name}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    def test_install(self):
+        releases = [_release('1.71.5'), _release('1.70.9')]
+        with patch('impl.cli.get_releases', return_value=releases):
+            exit_code, result = self._main(
+                'install', '--channel', 'nightly', '--version', '1.70.x',
+                '--installer', 'universal', '--delete-profile', '--launch'
+            )
+        self.assertEqual(0, exit_code)
+        self.assertTrue(result['ok'])
+        self.assertEqual('1.70.9', result['release']['version'])
+        self.assertEqual(
+            [Uninstall, DeleteProfile, Install, Launch], self.calls
+        )
+        statuses = [action['status'] for action in result['actions']]
+        self.assertEqual(['done'] * 4, statuses)
+    def test_failing_action(self):
+        with patch.object(Uninstall, '__call__', side_effect=OSError('x')):
+            exit_code, result = self._main('uninstall', '--channel', 'nightly')
+        self.assertEqual(1, exit_code)
+        self.assertFalse(result['ok'])
+        self.assertEqual('x', result['error'])
+        self.assertEqual('failed', result['actions'][0]['status'])
+    def test_uninstall_channel_that_is_not_installed(self):
+        exit_code, result = self._main('uninstall', '--channel', 'beta')
+        self.assertEqual(1, exit_code)
+        self.assertEqual([], result['actions'])
+    def test_prefetch(self):
+        releases = [_release('1.71.5'), _release('1.70.9')]
+        del releases[0]['installers']['Brave-Browser-arm64.dmg']
+        prefetch_actions = []
+        with patch('impl.cli.get_releases', return_value=releases), \
+                patch('impl.cli.run_actions', lambda actions, on_done:
+                      prefetch_actions.extend(actions)):
+            exit_code, result = self._main(
+                'prefetch', '--channel', 'nightly', '--num-versions', '2',
+                '--installer', 'arm64', '--installer', 'universal.pkg'
+            )
+        self.assertEqual(0, exit_code)
+        names = [
+            url.rsplit('/', 2)[1:] for url in prefetch_actions[0].installer_urls
+        ]
+        self.assertEqual([
+            ['v1.71.5', 'Brave-Browser-universal.pkg'],
+            ['v1.70.9', 'Brave-Browser-arm64.dmg'],
+            ['v1.70.9', 'Brave-Browser-universal.pkg']
+        ], names)
+    def _main(self, *argv):
+        stdout = StringIO()
+        with redirect_stdout(stdout), redirect_stderr(StringIO()):
+            exit_code = cli.main(list(argv))
+        return exit_code, json.loads(stdout.getvalue())
+    def _record_call(self, action_class):
+        def call(action):
+            self.calls.append(action_class)
+        return call
+
+def _release(version):
+    url = f'https://github.com/brave/brave-browser/releases/download/v{version}'
+    installers = {
+        name: f'{url}/{name}' for name in (
+            'Brave-Browser-universal.dmg', 'Brave-Browser-universal.pkg',
+            'Brave-Browser-arm64.dmg'
+        )
+    }
+    return {
+        'version': version,
+        'name': f'Nightly v{version}',
+        'published_at': '2025-01-01T00:00:00Z',
+        'prerelease': False,
+        'installers': installers
+    }
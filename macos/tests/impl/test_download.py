@@ -0,0 +1,122 @@
+from hashlib import sha256
+from impl import download
+from impl.download import BandwidthLimit, FileDownloader
+from os.path import exists, join
+from tests.http_server import Handler, start_server, stop_server
+from tempfile import TemporaryDirectory
+from time import monotonic
+from unittest import TestCase
+from unittest.mock import patch
+
+class FileDownloaderTest(TestCase):
+    def setUp(self):
+        self.content = bytes(range(256)) * 4096
+        self.server = _start_server(self.content)
+        self.addCleanup(stop_server, self.server)
+        self.url = self.server.url + '/file.dmg'
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = join(tmp_dir.name, 'file.dmg')
+        patcher = patch.object(download, '_MIN_SEGMENT_SIZE', 100_000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    def test_download_in_segments(self):
+        downloader = FileDownloader(self.url, self.path, num_connections=4)
+        self.assertEqual(len(self.content), downloader.start())
+        self.assertEqual(len(self.content), sum(downloader.run()))
+        self.assertEqual(4, len(self.server.ranges))
+        self._check_downloaded(downloader)
+    def test_resume(self):
+        downloader = FileDownloader(self.url, self.path, num_connections=4)
+        downloader.start()
+        progress = downloader.run()
+        next(progress)
+        progress.close()
+        self.assertFalse(exists(self.path))
+        self.assertTrue(exists(self.path + '.part.json'))
+        downloader = FileDownloader(self.url, self.path, num_connections=4)
+        downloader.start()
+        num_bytes_before = downloader.get_num_bytes_downloaded()
+        self.assertGreater(num_bytes_before, 0)
+        num_bytes_after = sum(downloader.run())
+        self.assertEqual(len(self.content), num_bytes_before + num_bytes_after)
+        self._check_downloaded(downloader)
+    def test_server_without_range_support(self):
+        self.server.supports_ranges = False
+        downloader = FileDownloader(self.url, self.path, num_connections=4)
+        downloader.start()
+        self.assertEqual(len(self.content), sum(downloader.run()))
+        self.assertEqual([], self.server.ranges)
+        self._check_downloaded(downloader)
+    def test_server_cuts_download_short(self):
+        self.server.supports_ranges = False
+        self.server.truncate = True
+        downloader = FileDownloader(self.url, self.path)
+        downloader.start()
+        with self.assertRaises(Exception):
+            sum(downloader.run())
+        self.assertFalse(exists(self.path))
+    def test_bandwidth_limit(self):
+        # At this rate, the download takes 1.25s. Minus the burst of one second
+        # that is allowed at the start, this leaves 0.25s.
+        bandwidth_limit = BandwidthLimit(len(self.content) / 1.25)
+        downloader = FileDownloader(
+            self.url, self.path, num_connections=4,
+            bandwidth_limit=bandwidth_limit
+        )
+        downloader.start()
+        start_time = monotonic()
+        sum(downloader.run())
+        self.assertGreater(monotonic() - start_time, 0.2)
+        self._check_downloaded(downloader)
+    def _check_downloaded(self, downloader):
+        with open(self.path, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+        expected_sha256 = sha256(self.content).hexdigest()
+        self.assertEqual(expected_sha256, downloader.get_sha256())
+        self.assertFalse(exists(self.path + '.part'))
+        self.assertFalse(exists(self.path + '.part.json'))
+
+class BandwidthLimitTest(TestCase):
+    def test_parent_limit(self):
+        # The parent's limit is lower. At its rate, this takes 0.125s.
+        parent = BandwidthLimit(10_000)
+        bandwidth_limit = BandwidthLimit(10 ** 9, parent)
+        start_time = monotonic()
+        for _ in range(5):
+            bandwidth_limit.consume(250)
+        self.assertGreater(monotonic() - start_time, 0.1)
+
+class HostSemaphoreTest(TestCase):
+    def test_one_semaphore_per_host(self):
+        get = download.get_host_semaphore
+        self.assertIs(get('https://github.com/a'), get('https://github.com/b'))
+        self.assertIsNot(get('https://github.com/a'), get('http://mirror/a'))
+
+def _start_server(content):
+    class FileHandler(Handler):
+        def do_GET(self):
+            range_header = self.headers.get('Range')
+            if range_header and server.supports_ranges:
+                server.ranges.append(range_header)
+                start, end = range_header.split('=')[1].split('-')
+                body = content[int(start):int(end) + 1]
+                self.send_response(206)
+            else:
+                body = content
+                self.send_response(200)
+            if server.supports_ranges:
+                self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if server.truncate:
+                body = body[:len(body) // 2]
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                pass
+    server = start_server(FileHandler)
+    server.ranges = []
+    server.supports_ranges = True
+    server.truncate = False
+    return server
@@ -0,0 +1,157 @@
+from impl import config, download, mirrors
+from impl.actions import download_file, DownloadProgress
+from os.path import join
+from tempfile import TemporaryDirectory
+from tests.http_server import Handler, start_server, stop_server
+from time import sleep
+from unittest import TestCase
+from unittest.mock import patch
+
+_PATH = '/github.com/brave/brave-browser/releases/download/v1.2.3/Brave.dmg'
+
+class GetSourcesTest(TestCase):
+    def setUp(self):
+        patcher = patch.object(config, 'MIRROR_TIMEOUT', 0.5)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = self._start_server() + _PATH
+    def test_without_mirrors(self):
+        self.assertEqual([self.url], mirrors.get_sources(self.url, []))
+    def test_fastest_mirror_first(self):
+        slow = self._start_server(delay=0.2)
+        fast = self._start_server()
+        self.assertEqual(
+            [self._get_mirror_url(fast), self._get_mirror_url(slow), self.url],
+            mirrors.get_sources(self.url, [slow, fast + '/'])
+        )
+    def test_skips_mirrors_without_the_file(self):
+        mirror = self._start_server(has_file=False)
+        self.assertEqual([self.url], mirrors.get_sources(self.url, [mirror]))
+    def test_skips_mirrors_with_a_different_size(self):
+        other_size = self._start_server(b'incomplete')
+        mirror = self._start_server()
+        self.assertEqual(
+            [self._get_mirror_url(mirror), self.url],
+            mirrors.get_sources(self.url, [other_size, mirror])
+        )
+    def test_skips_mirrors_that_are_down_or_too_slow(self):
+        # Nothing listens on port 9 (discard) on the loopback interface.
+        down = 'http://127.0.0.1:9'
+        too_slow = self._start_server(delay=1)
+        mirror = self._start_server()
+        self.assertEqual(
+            [self._get_mirror_url(mirror), self.url],
+            mirrors.get_sources(self.url, [down, too_slow, mirror])
+        )
+    def test_waits_longer_for_slow_origin(self):
+        # Eg. GitHub's redirect to its CDN over a slow office link.
+        url = self._start_server(delay=1) + _PATH
+        mirror = self._start_server()
+        self.assertEqual(
+            [mirrors.get_mirror_url(mirror, url), url],
+            mirrors.get_sources(url, [mirror])
+        )
+    def test_no_mirrors_when_size_is_unknown(self):
+        url = self._start_server(has_file=False) + _PATH
+        mirror = self._start_server()
+        self.assertEqual([url], mirrors.get_sources(url, [mirror]))
+    def _get_mirror_url(self, mirror):
+        return mirrors.get_mirror_url(mirror, self.url)
+    def _start_server(self, content=b'installer', has_file=True, delay=0):
+        server = _start_server(content, has_file, delay)
+        self.addCleanup(stop_server, server)
+        return server.url
+
+class DownloadFileTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = join(tmp_dir.name, 'Brave.dmg')
+        self.content = bytes(range(256)) * 2048
+    def test_downloads_from_mirror(self):
+        mirror = self._start_server(self.content)
+        # Same size, so the mirror is used, but different bytes.
+        github = self._start_server(bytes(len(self.content)))
+        self._download(github + _PATH, [mirror])
+        self._check_downloaded()
+    def test_falls_back_to_github_when_mirror_fails(self):
+        mirror = self._start_server(self.content, fail_get=True)
+        github = self._start_server(self.content)
+        self._download(github + _PATH, [mirror])
+        self._check_downloaded()
+    def test_resumes_from_github_when_mirror_fails_partway(self):
+        # One segment of 16 blocks. The mirror closes the connection after 4.
+        block_size = 16 * 1024
+        for name, value in (
+            ('_BLOCK_SIZE', block_size), ('_MIN_SEGMENT_SIZE', block_size)
+        ):
+            patcher = patch.object(download, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(config, 'DOWNLOAD_CONNECTIONS', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.content = self.content[:16 * block_size]
+        num_bytes_from_mirror = 4 * block_size
+        mirror = self._start_server(
+            self.content, num_bytes_per_range=num_bytes_from_mirror
+        )
+        ranges = []
+        github = self._start_server(self.content, ranges=ranges)
+        self._download(github + _PATH, [mirror])
+        self._check_downloaded()
+        self.assertEqual(
+            [f'bytes={num_bytes_from_mirror}-{len(self.content) - 1}'], ranges
+        )
+    def _download(self, url, mirror_urls):
+        with patch.object(config, 'DOWNLOAD_MIRRORS', mirror_urls):
+            download_file(url, self.path, DownloadProgress(url))
+    def _check_downloaded(self):
+        with open(self.path, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+    def _start_server(self, content, fail_get=False, **kwargs):
+        server = _start_server(content, fail_get=fail_get, **kwargs)
+        self.addCleanup(stop_server, server)
+        return server.url
+
+def _start_server(
+    content, has_file=True, delay=0, fail_get=False, num_bytes_per_range=None,
+    ranges=None
+):
+    # Serves `content` at every path that ends with _PATH. Supports range
+    # requests, but sends at most `num_bytes_per_range` of each range before
+    # it closes the connection. Appends the requested ranges to `ranges`.
+    class MirrorHandler(Handler):
+        def do_HEAD(self):
+            sleep(delay)
+            self._send_headers(200, len(content))
+        def do_GET(self):
+            if fail_get:
+                self.send_body(404, b'')
+                return
+            range_ = self.headers.get('Range')
+            if range_ is None:
+                if self._send_headers(200, len(content)):
+                    self.wfile.write(content)
+                return
+            if ranges is not None:
+                ranges.append(range_)
+            start, end = map(int, range_[len('bytes='):].split('-'))
+            if self._send_headers(206, end + 1 - start, {
+                'Content-Range': f'bytes {start}-{end}/{len(content)}'
+            }):
+                self.wfile.write(
+                    content[start:end + 1][:num_bytes_per_range]
+                )
+        def _send_headers(self, status, content_length, headers=None):
+            if not has_file or not self.path.endswith(_PATH):
+                self.send_body(404, b'')
+                return False
+            self.send_response(status)
+            self.send_header('Content-Length', str(content_length))
+            self.send_header('Accept-Ranges', 'bytes')
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            return True
+    return start_server(MirrorHandler)
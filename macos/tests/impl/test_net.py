@@ -0,0 +1,37 @@
+from impl import config, net
+from tests.http_server import Handler, start_server, stop_server
+from unittest import TestCase
+from unittest.mock import patch
+
+class NetTest(TestCase):
+    def setUp(self):
+        self.responses = []
+        self.server = _start_server(self.responses)
+        self.addCleanup(stop_server, self.server)
+        patcher = patch.object(config, 'GITHUB_API_URL', self.server.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    def test_github_api_url(self):
+        self.responses.append((200, b'[]'))
+        response = net.get(net.github_api_url('/repos'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['/repos'], self.server.paths)
+    def test_retries_server_errors(self):
+        self.responses.extend([(503, b''), (200, b'{}')])
+        response = net.get(net.github_api_url('/releases'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(self.server.paths))
+    def test_does_not_retry_client_errors(self):
+        self.responses.extend([(404, b''), (200, b'{}')])
+        response = net.get(net.github_api_url('/releases'))
+        self.assertEqual(404, response.status_code)
+
+def _start_server(responses):
+    class ReplayHandler(Handler):
+        def do_GET(self):
+            server.paths.append(self.path)
+            status, body = responses.pop(0)
+            self.send_body(status, body)
+    server = start_server(ReplayHandler)
+    server.paths = []
+    return server
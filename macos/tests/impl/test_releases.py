@@ -0,0 +1,417 @@
+from contextlib import redirect_stdout
+from impl import cache, config, releases
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch, MagicMock, Mock
+from impl.release_store import ReleaseStore
+from impl.releases import _paginate_releases, _fetch_releases_page, \
+    _add_releases, group_by_minor_version, HistoricReleases, \
+    update_historic_releases
+from os.path import getmtime, join
+from tempfile import TemporaryDirectory
+from tests.http_server import Handler, start_server, stop_server
+from threading import Event, Lock, Timer
+from time import sleep
+from zipfile import ZipFile
+
+import json
+
+class PaginateReleasesTest(TestCase):
+    def setUp(self):
+        self.fetched_pages = []
+        self.lock = Lock()
+    def test_pages_are_yielded_in_order(self):
+        # Earlier pages take longer, so they complete out of order:
+        delay = lambda page: 0.01 * (7 - page)
+        pages = self._paginate(num_pages=6, delay=delay)
+        self.assertEqual([[1], [2], [3], [4], [5], [6]], list(pages))
+    def test_stops_at_empty_page(self):
+        self.assertEqual(3, len(list(self._paginate(num_pages=3))))
+    def test_only_first_page_is_fetched_initially(self):
+        pages = self._paginate(num_pages=20)
+        next(pages)
+        pages.close()
+        self.assertEqual([1], self.fetched_pages)
+    def test_fetches_ahead_when_more_pages_are_needed(self):
+        pages = self._paginate(num_pages=20)
+        next(pages)
+        next(pages)
+        pages.close()
+        self.assertLessEqual(len(self.fetched_pages), 5)
+    def test_stops_at_known_release(self):
+        pages = self._paginate(num_pages=20, last_page=2)
+        self.assertEqual([[1], [2]], list(pages))
+    def test_errors_are_propagated(self):
+        def fetch(page, validators, is_known):
+            if page == 3:
+                raise RuntimeError('Too many releases')
+            return [page], {}, False
+        with patch('impl.releases._fetch_releases_page', fetch):
+            pages = _paginate_releases({}, None, num_workers=4)
+            self.assertEqual([1], next(pages))
+            self.assertEqual([2], next(pages))
+            with self.assertRaises(RuntimeError):
+                next(pages)
+    def _paginate(self, num_pages, delay=lambda page: 0, last_page=None):
+        # `last_page` contains a known release.
+        def fetch(page, validators, is_known):
+            with self.lock:
+                self.fetched_pages.append(page)
+            sleep(delay(page))
+            items = [page] if page <= num_pages else []
+            return items, {}, not items or page == last_page
+        with patch('impl.releases._fetch_releases_page', fetch):
+            yield from _paginate_releases({}, None, num_workers=4)
+
+class FetchReleasesPageTest(TestCase):
+    def test_sends_validators(self):
+        result = self._fetch({'etag': '"abc"'}, 200, {'etag': '"def"'})
+        headers = self.get.call_args.kwargs['headers']
+        self.assertEqual('"abc"', headers['If-None-Match'])
+        self.assertEqual({'etag': '"def"'}, result[1])
+    def test_not_modified(self):
+        result = self._fetch({'etag': '"abc"'}, 304, {'etag': '"abc"'})
+        self.assertEqual(([], {'etag': '"abc"'}, True), result)
+    def test_keeps_only_installers(self):
+        items, _, is_last = self._fetch({}, 200, {})
+        self.assertEqual(['2', '1'], [cache_id for cache_id, _ in items])
+        assets = items[0][1]['assets']
+        self.assertEqual(['Brave.dmg'], [asset['name'] for asset in assets])
+        self.assertFalse(is_last)
+    def test_stops_reading_at_known_release(self):
+        items, _, is_last = self._fetch({}, 200, {}, known_ids={'2'})
+        self.assertEqual([], items)
+        self.assertTrue(is_last)
+        # The second release is in the later chunks.
+        self.assertLess(self.num_chunks_read, len(self.chunks))
+    def test_empty_page(self):
+        result = self._fetch({}, 200, {}, body=b'[]')
+        self.assertEqual(([], {}, True), result)
+    def _fetch(self, validators, status_code, response_headers, body=None,
+               known_ids=()):
+        if body is None:
+            body = json.dumps([
+                _release('Nightly v1.0.2', id=2),
+                _release('Nightly v1.0.1', id=1)
+            ]).encode()
+        self.chunks = [body[i:i + 16] for i in range(0, len(body), 16)]
+        self.num_chunks_read = 0
+        def iter_content(chunk_size):
+            for chunk in self.chunks:
+                self.num_chunks_read += 1
+                yield chunk
+        response = MagicMock(status_code=status_code, headers=response_headers)
+        response.__enter__.return_value = response
+        response.iter_content = iter_content
+        with patch('impl.net.get', return_value=response) as self.get:
+            return _fetch_releases_page(
+                1, validators, lambda cache_id: cache_id in known_ids
+            )
+
+class ReleaseStoreTest(TestCase):
+    def setUp(self):
+        self.store = ReleaseStore(':memory:')
+        self.addCleanup(self.store.close)
+    def test_releases_are_sorted_by_channel_and_version(self):
+        _add_releases(self.store, {
+            '1': _release('Nightly v1.9.10'),
+            '2': _release('Nightly v1.10.1', prerelease=True),
+            '3': _release('Beta v1.9.2'),
+            '4': _release('Nightly v1.10.0'),
+        })
+        nightly = self.store.get_installable('nightly', public_only=False)
+        versions = [r['version'] for r in nightly]
+        self.assertEqual(['1.10.1', '1.10.0', '1.9.10'], versions)
+        public = self.store.get_installable('nightly', public_only=True)
+        self.assertEqual(['1.10.0', '1.9.10'], [r['version'] for r in public])
+        grouped = group_by_minor_version(nightly)
+        self.assertEqual(['1.10.x', '1.9.x'], list(grouped))
+    def test_releases_without_installers_are_not_installable(self):
+        release = _release('Nightly v1.9.10')
+        release['assets'] = []
+        dev_release = _release('Dev v1.0.0')
+        _add_releases(self.store, {'1': release, '2': dev_release})
+        # They are still stored, so we know that we have seen them.
+        self.assertEqual({'1', '2'}, self.store.get_ids())
+        self.assertEqual([], self.store.get_installable('nightly', False))
+    def test_add_is_idempotent(self):
+        releases = {'1': _release('Nightly v1.9.10')}
+        _add_releases(self.store, releases)
+        _add_releases(self.store, releases)
+        self.assertEqual(1, len(self.store.get_installable('nightly', False)))
+    def test_values(self):
+        self.assertEqual({}, self.store.get_value('validators', {}))
+        self.store.set_value('validators', {'1': {'etag': 'abc'}})
+        self.assertEqual(
+            {'1': {'etag': 'abc'}}, self.store.get_value('validators')
+        )
+
+class HistoricReleasesTest(TestCase):
+    def test_write_and_read(self):
+        releases = {
+            '1': _release('Nightly v1.9.10'),
+            '2': _release('Beta v1.9.2'),
+            '3': _release('Android v1.9.3')
+        }
+        with TemporaryDirectory() as tmp_dir:
+            historic_releases = HistoricReleases(join(tmp_dir, 'h.zip'))
+            historic_releases.write(releases)
+            nightly = historic_releases.read_channel('nightly')
+            self.assertEqual({'1': releases['1']}, nightly)
+            self.assertEqual({}, historic_releases.read_channel('release'))
+            self.assertEqual(['1', '2', '3'], historic_releases.read_ids())
+            self.assertEqual(releases, historic_releases.read_all())
+
+class BackgroundRefreshTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        cache_dir = join(tmp_dir.name, '.cache')
+        zip_path = join(tmp_dir.name, 'historic-releases.zip')
+        HistoricReleases(zip_path).write({'1': _release('Nightly v1.0.1')})
+        self.github_responds = Event()
+        self.github_error = None
+        def paginate_releases(validators, is_known):
+            self.github_responds.wait()
+            if self.github_error:
+                raise self.github_error
+            yield [('2', _release('Nightly v1.0.2', id=2))]
+        for patcher in (
+            patch.object(cache, 'CACHE_DIR', cache_dir),
+            patch.object(releases, 'HISTORIC_RELEASES', zip_path),
+            patch.object(releases, '_paginate_releases', paginate_releases),
+            patch.object(releases, '_background_refresh', None),
+            patch.object(releases, '_background_refresh_error', None)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.github_responds.set)
+    def test_serves_cache_while_refreshing(self):
+        self._set_fetched_long_ago()
+        releases.start_background_refresh()
+        self.assertEqual(['1.0.1'], self._get_versions())
+        self.github_responds.set()
+        releases._background_refresh.join()
+        self.assertEqual(['1.0.2', '1.0.1'], self._get_versions())
+    def test_waits_for_refresh_if_never_fetched(self):
+        releases.start_background_refresh()
+        Timer(0.1, self.github_responds.set).start()
+        self.assertEqual(['1.0.2', '1.0.1'], self._get_versions())
+    def test_reports_refresh_error_if_never_fetched(self):
+        self.github_error = ConnectionError('Offline')
+        self.github_responds.set()
+        releases.start_background_refresh()
+        with self.assertRaises(ConnectionError):
+            self._get_versions()
+    def test_reports_out_of_date_historic_releases(self):
+        self._set_fetched_long_ago()
+        self.github_error = RuntimeError('historic-releases.zip out of date')
+        self.github_responds.set()
+        releases.start_background_refresh()
+        releases._background_refresh.join()
+        with self.assertRaises(RuntimeError):
+            self._get_versions()
+    def test_warns_about_refresh_error_if_fetched_before(self):
+        self._set_fetched_long_ago()
+        self.github_error = ConnectionError('Offline')
+        self.github_responds.set()
+        releases.start_background_refresh()
+        releases._background_refresh.join()
+        with redirect_stdout(StringIO()) as stdout:
+            self.assertEqual(['1.0.1'], self._get_versions())
+        self.assertIn('Offline', stdout.getvalue())
+    def test_fetches_inline_without_background_refresh(self):
+        self.github_responds.set()
+        self.assertEqual(['1.0.2', '1.0.1'], self._get_versions())
+    def _set_fetched_long_ago(self):
+        with ReleaseStore(cache.prepare('releases.sqlite3')) as store:
+            store.set_value('fetched_at', 0)
+    def _get_versions(self):
+        return [
+            r['version'] for r in releases.get_releases('nightly', False)
+        ]
+
+class UpdateHistoricReleasesTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.zip_path = join(tmp_dir.name, 'historic-releases.zip')
+        patcher = patch('impl.releases.HISTORIC_RELEASES', self.zip_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        HistoricReleases(self.zip_path).write({
+            '1': _release('Nightly v1.0.1')
+        })
+        self.responses = {}
+        self.lock = Lock()
+    def test_fetches_missing_tags(self):
+        self.responses = {
+            'v1.0.2': [_response(200, _release('Nightly v1.0.2', id=2))],
+            'v1.0.3': [_response(404)]
+        }
+        wait_times = self._update(['v1.0.1', 'v1.0.2', 'v1.0.3'])
+        self.assertEqual([], wait_times)
+        releases = HistoricReleases(self.zip_path).read_all()
+        self.assertEqual(['1', '2'], sorted(releases))
+    def test_waits_for_rate_limit(self):
+        self.responses = {
+            'v1.0.2': [
+                _response(403, remaining=0, reset=2_000_000_000),
+                _response(200, _release('Nightly v1.0.2', id=2))
+            ]
+        }
+        with patch('impl.releases.time', return_value=1_999_999_990):
+            wait_times = self._update(['v1.0.2'])
+        self.assertEqual([10], wait_times)
+        releases = HistoricReleases(self.zip_path).read_all()
+        self.assertEqual(['1', '2'], sorted(releases))
+    def test_pauses_before_rate_limit_is_exhausted(self):
+        self.responses = {
+            f'v1.0.{i}': [_response(
+                200, _release(f'Nightly v1.0.{i}', id=i), remaining, 100
+            )]
+            for i, remaining in ((2, 1), (3, 0), (4, 4999))
+        }
+        with patch('impl.releases.time', return_value=90):
+            wait_times = self._update(['v1.0.2', 'v1.0.3', 'v1.0.4'], 1)
+        self.assertEqual([10], wait_times)
+        releases = HistoricReleases(self.zip_path).read_all()
+        self.assertEqual(['1', '2', '3', '4'], sorted(releases))
+    def test_writes_releases_when_interrupted(self):
+        self.responses = {
+            'v1.0.2': [_response(200, _release('Nightly v1.0.2', id=2))],
+            'v1.0.3': [_response(500)]
+        }
+        with self.assertRaises(Exception):
+            self._update(['v1.0.2', 'v1.0.3'], num_workers=1)
+        releases = HistoricReleases(self.zip_path).read_all()
+        self.assertEqual(['1', '2'], sorted(releases))
+    def test_resumes_from_journal_after_crash(self):
+        self.responses = {
+            'v1.0.2': [_response(200, _release('Nightly v1.0.2', id=2))]
+        }
+        # Simulate a crash before the journal is folded into the Zip file:
+        with patch.object(HistoricReleases, 'write', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                self._update(['v1.0.2'])
+        historic_releases = HistoricReleases(self.zip_path)
+        self.assertTrue(historic_releases.has_journal())
+        self.assertEqual(['1', '2'], sorted(historic_releases.read_all()))
+        # The next run does not fetch v1.0.2 again and folds the journal:
+        self.assertEqual([], self._update(['v1.0.2']))
+        self.assertFalse(historic_releases.has_journal())
+        with ZipFile(self.zip_path) as zf:
+            nightly = json.loads(zf.read('nightly.json'))
+        self.assertEqual(['1', '2'], sorted(nightly))
+    def test_nothing_to_fetch(self):
+        mtime_before = getmtime(self.zip_path)
+        self.assertEqual([], self._update(['v1.0.1']))
+        self.assertEqual(mtime_before, getmtime(self.zip_path))
+    def _update(self, tags, num_workers=4):
+        def get(url, headers):
+            with self.lock:
+                return self.responses[url.rsplit('/', 1)[1]].pop(0)
+        with patch('impl.net.get', get):
+            return list(update_historic_releases(
+                tags, 'token', num_workers=num_workers
+            ))
+
+class UpdateHistoricReleasesViaGraphQLTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.zip_path = join(tmp_dir.name, 'historic-releases.zip')
+        HistoricReleases(self.zip_path).write({})
+        self.server = _start_graphql_server()
+        self.addCleanup(stop_server, self.server)
+        for patcher in (
+            patch('impl.releases.HISTORIC_RELEASES', self.zip_path),
+            patch.object(config, 'GITHUB_API_URL', self.server.url)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    def test_batches_and_asset_pages(self):
+        self.server.responses.extend([
+            {'data': {'repository': {
+                'r0': _graphql_release('v1.0.1', 1, has_more_assets=True),
+                'r1': None
+            }}},
+            {'data': {'repository': {'release': {'releaseAssets': {
+                'pageInfo': {'hasNextPage': False, 'endCursor': 'b'},
+                'nodes': [{'name': 'b.pkg', 'downloadUrl': 'https://b.pkg'}]
+            }}}}},
+            {'data': {'repository': {'r0': _graphql_release('v1.0.3', 3)}}}
+        ])
+        with patch('impl.releases.GRAPHQL_BATCH_SIZE', 2):
+            wait_times = list(update_historic_releases(
+                ['v1.0.1', 'v1.0.2', 'v1.0.3'], 'token', use_graphql=True
+            ))
+        self.assertEqual([], wait_times)
+        self.assertEqual(3, len(self.server.requests))
+        first_query = self.server.requests[0]['query']
+        self.assertIn('r1: release(tagName: "v1.0.2")', first_query)
+        self.assertEqual('a', self.server.requests[1]['variables']['after'])
+        releases = HistoricReleases(self.zip_path).read_all()
+        self.assertEqual({
+            'name': 'Nightly v1.0.1',
+            'tag_name': 'v1.0.1',
+            'prerelease': False,
+            'assets': [
+                {'name': 'a.dmg', 'browser_download_url': 'https://a.dmg'},
+                {'name': 'b.pkg', 'browser_download_url': 'https://b.pkg'}
+            ],
+            'published_at': '2025-01-01T00:00:00Z'
+        }, releases['1'])
+        self.assertEqual(['1', '3'], sorted(releases))
+
+def _graphql_release(tag_name, database_id, has_more_assets=False):
+    return {
+        'databaseId': database_id,
+        'name': f'Nightly {tag_name}',
+        'tagName': tag_name,
+        'isPrerelease': False,
+        'publishedAt': '2025-01-01T00:00:00Z',
+        'releaseAssets': {
+            'pageInfo': {'hasNextPage': has_more_assets, 'endCursor': 'a'},
+            'nodes': [{'name': 'a.dmg', 'downloadUrl': 'https://a.dmg'}]
+        }
+    }
+
+def _start_graphql_server():
+    # Replays canned responses to POST requests.
+    class GraphQLHandler(Handler):
+        def do_POST(self):
+            length = int(self.headers['Content-Length'])
+            server.requests.append(json.loads(self.rfile.read(length)))
+            body = json.dumps(server.responses.pop(0)).encode()
+            self.send_body(200, body, {'Content-Type': 'application/json'})
+    server = start_server(GraphQLHandler)
+    server.requests = []
+    server.responses = []
+    return server
+
+def _response(status_code, json=None, remaining=None, reset=None):
+    headers = {}
+    if remaining is not None:
+        headers['x-ratelimit-remaining'] = str(remaining)
+        headers['x-ratelimit-reset'] = str(reset)
+    result = Mock(status_code=status_code, headers=headers)
+    result.json.return_value = json
+    if status_code >= 400:
+        result.raise_for_status.side_effect = RuntimeError(status_code)
+    return result
+
+def _release(name, prerelease=False, id=None):
+    tag_name = name.split(' ')[1]
+    url = f'https://github.com/brave/brave-browser/releases/download/{tag_name}'
+    return {
+        'id': id,
+        'name': name,
+        'tag_name': tag_name,
+        'prerelease': prerelease,
+        'assets': [
+            {'name': 'Brave.dmg', 'browser_download_url': f'{url}/Brave.dmg'},
+            {'name': 'brave.deb', 'browser_download_url': f'{url}/brave.deb'}
+        ],
+        'published_at': '2025-01-01T00:00:00Z'
+    }
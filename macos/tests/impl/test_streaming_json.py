@@ -0,0 +1,33 @@
+from impl.streaming_json import iter_array
+from unittest import TestCase
+
+import json
+
+class IterArrayTest(TestCase):
+    def test_split_at_every_position(self):
+        values = [
+            {'name': 'Nightly v1.0.2', 'assets': [{'size': 123}]},
+            12345, -1.5e3, 'Grüße, "Welt" ]', None, True, [], {}
+        ]
+        data = json.dumps(values, ensure_ascii=False).encode()
+        for i in range(len(data) + 1):
+            self.assertEqual(values, list(iter_array([data[:i], data[i:]])))
+    def test_one_byte_at_a_time(self):
+        values = [{'id': 1}, {'id': 22}, 333]
+        data = b' [ ' + json.dumps(values).encode()[1:-1] + b' ]\n'
+        chunks = [data[i:i + 1] for i in range(len(data))]
+        self.assertEqual(values, list(iter_array(chunks)))
+    def test_empty_array(self):
+        self.assertEqual([], list(iter_array([b'[', b' ]'])))
+    def test_stops_reading_when_caller_stops(self):
+        read = []
+        def chunks():
+            for chunk in (b'[{"id": 1},', b'{"id": 2},', b'{"id": 3}]'):
+                read.append(chunk)
+                yield chunk
+        self.assertEqual({'id': 1}, next(iter_array(chunks())))
+        self.assertEqual(1, len(read))
+    def test_invalid_data(self):
+        for data in (b'{"id": 1}', b'[1 2]', b'[{"id": 1}', b'[1,', b''):
+            with self.assertRaises(ValueError):
+                list(iter_array([data]))
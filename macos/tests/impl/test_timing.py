@@ -0,0 +1,77 @@
+from impl import timing
+from io import StringIO
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+
+import json
+
+class TimingTest(TestCase):
+    def setUp(self):
+        timing.clear()
+        self.addCleanup(timing.clear)
+    def test_span(self):
+        with timing.span('download', url='https://example.com') as record:
+            sleep(0.001)
+            record['bytes'] = 1000
+        record, = timing.get_records()
+        self.assertEqual('download', record['name'])
+        self.assertEqual('https://example.com', record['url'])
+        self.assertGreater(record['duration'], 0)
+        self.assertAlmostEqual(
+            1000 / record['duration'], record['bytes_per_second']
+        )
+    def test_nested_spans(self):
+        with timing.span('install_dmg'):
+            with timing.span('copy_tree'):
+                pass
+        self.assertEqual(
+            [('install_dmg', 0), ('copy_tree', 1)],
+            [(r['name'], r['depth']) for r in timing.get_records()]
+        )
+    def test_spans_in_other_threads_are_not_nested(self):
+        with timing.span('install'):
+            thread = Thread(target=self._record_span, args=('download',))
+            thread.start()
+            thread.join()
+        depths = {r['name']: r['depth'] for r in timing.get_records()}
+        self.assertEqual({'install': 0, 'download': 0}, depths)
+    def test_error(self):
+        @timing.timed('uninstall')
+        def uninstall():
+            raise PermissionError()
+        with self.assertRaises(PermissionError):
+            uninstall()
+        record, = timing.get_records()
+        self.assertEqual('PermissionError', record['error'])
+    def test_write_log(self):
+        self._record_span('download')
+        with TemporaryDirectory() as tmp_dir:
+            path = join(tmp_dir, 'logs', 'timing.jsonl')
+            timing.write_log(path)
+            timing.write_log(path)
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(2, len(records))
+        self.assertEqual('download', records[0]['name'])
+        self.assertIn('session', records[0])
+    def test_write_log_without_path(self):
+        self._record_span('download')
+        timing.write_log('')
+    def test_print_summary(self):
+        with timing.span('download') as record:
+            record['bytes'] = 2_000_000
+        with timing.span('brave.uninstall'):
+            pass
+        output = StringIO()
+        timing.print_summary(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertIn('2 MB', lines[1])
+        self.assertTrue(lines[1].endswith('download'))
+        self.assertTrue(lines[2].endswith('brave.uninstall'))
+    def _record_span(self, name):
+        with timing.span(name):
+            pass
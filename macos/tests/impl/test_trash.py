@@ -0,0 +1,38 @@
+from impl import trash
+from os import listdir, makedirs
+from os.path import exists, join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+class TrashTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.profile_dir = join(self.tmp_dir, 'Brave-Browser')
+        makedirs(join(self.profile_dir, 'Default'))
+        with open(join(self.profile_dir, 'Default', 'History'), 'w') as f:
+            f.write('history')
+    def test_move_to_trash(self):
+        trash_dir = trash.move_to_trash(self.profile_dir)
+        self.assertFalse(exists(self.profile_dir))
+        self.assertEqual(join(self.tmp_dir, trash.TRASH_DIR_NAME), trash_dir)
+        # The same name can be moved to the trash again.
+        makedirs(self.profile_dir)
+        trash.move_to_trash(self.profile_dir)
+        self.assertEqual(2, len(listdir(trash_dir)))
+    def test_move_missing_file_to_trash(self):
+        with self.assertRaises(FileNotFoundError):
+            trash.move_to_trash(join(self.tmp_dir, 'missing'))
+    def test_empty_in_background(self):
+        plist = join(self.tmp_dir, 'com.brave.Browser.plist')
+        with open(plist, 'w') as f:
+            f.write('plist')
+        trash_dir = trash.move_to_trash(self.profile_dir)
+        trash.move_to_trash(plist)
+        process = trash.empty_in_background([trash_dir])
+        self.assertEqual(0, process.wait(timeout=30))
+        self.assertFalse(exists(trash_dir))
+    def test_nothing_to_empty(self):
+        trash_dir = join(self.tmp_dir, trash.TRASH_DIR_NAME)
+        self.assertIsNone(trash.empty_in_background([trash_dir]))
@@ -0,0 +1,123 @@
+from impl import tree
+from impl.tree import copy_tree, remove_tree, TreeError
+from os import chmod, listdir, makedirs, readlink, stat, symlink
+from os.path import exists, islink, join
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import os
+
+class RemoveTreeTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.root = join(self.tmp_dir, 'Brave Browser.app')
+        self.num_files = 0
+        for i in range(5):
+            for j in range(3):
+                dir_path = join(self.root, f'dir{i}', f'subdir{j}')
+                makedirs(dir_path)
+                for k in range(10):
+                    with open(join(dir_path, f'file{k}'), 'wb') as f:
+                        f.write(b'x' * 10)
+                    self.num_files += 1
+        makedirs(join(self.root, 'empty'))
+    def test_remove(self):
+        progress = []
+        with patch.object(tree, '_BATCH_SIZE', 4):
+            remove_tree(self.root, lambda *args: progress.append(args))
+        self.assertFalse(exists(self.root))
+        self.assertEqual((self.num_files, self.num_files * 10), progress[-1])
+    def test_symlinks_are_not_followed(self):
+        target = join(self.tmp_dir, 'target')
+        makedirs(target)
+        symlink(target, join(self.root, 'link'))
+        remove_tree(self.root)
+        self.assertFalse(exists(self.root))
+        self.assertTrue(exists(target))
+    @skipUnless(os.name == 'nt', 'Needs Windows junctions')
+    def test_junctions_are_not_followed(self):
+        import _winapi
+        target = join(self.tmp_dir, 'target')
+        makedirs(target)
+        with open(join(target, 'file'), 'wb') as f:
+            f.write(b'x')
+        _winapi.CreateJunction(target, join(self.root, 'junction'))
+        remove_tree(self.root)
+        self.assertFalse(exists(self.root))
+        self.assertTrue(exists(join(target, 'file')))
+    def test_file(self):
+        path = join(self.root, 'dir0', 'subdir0', 'file0')
+        remove_tree(path)
+        self.assertFalse(exists(path))
+    def test_missing(self):
+        with self.assertRaises(FileNotFoundError):
+            remove_tree(join(self.tmp_dir, 'missing'))
+    def test_errors_are_aggregated(self):
+        in_use = join(self.root, 'dir1', 'subdir0')
+        def unlink(path):
+            if path.startswith(in_use):
+                raise PermissionError(path)
+            os.unlink(path)
+        with patch.object(tree, 'unlink', unlink), \
+                self.assertRaises(TreeError) as context:
+            remove_tree(self.root)
+        self.assertEqual(10, len(context.exception.errors))
+        # Everything else was removed.
+        self.assertFalse(exists(join(self.root, 'dir0')))
+        self.assertFalse(exists(join(self.root, 'dir1', 'subdir1')))
+        self.assertTrue(exists(join(in_use, 'file0')))
+
+class CopyTreeTest(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = join(tmp_dir.name, 'Brave Browser.app')
+        self.dst = join(tmp_dir.name, 'copy')
+        macos_dir = join(self.src, 'Contents', 'MacOS')
+        makedirs(macos_dir)
+        self.executable = join(macos_dir, 'Brave Browser')
+        with open(self.executable, 'wb') as f:
+            f.write(b'binary' * 1000)
+        chmod(self.executable, 0o755)
+        frameworks_dir = join(self.src, 'Contents', 'Frameworks')
+        makedirs(join(frameworks_dir, 'Versions', 'A'))
+        for i in range(10):
+            with open(join(frameworks_dir, 'Versions', 'A', str(i)), 'w') as f:
+                f.write(str(i))
+        symlink('Versions/A', join(frameworks_dir, 'Current'))
+    def test_copy(self):
+        progress = []
+        with patch.object(tree, '_BATCH_SIZE', 4):
+            copy_tree(self.src, self.dst, lambda *args: progress.append(args))
+        self._check_copied()
+        self.assertEqual((12, 6000 + 10), progress[-1])
+    @skipUnless(hasattr(os, 'setxattr'), 'Needs os.setxattr(...)')
+    def test_extended_attributes(self):
+        try:
+            os.setxattr(self.executable, 'user.brave', b'manager')
+        except OSError:
+            self.skipTest('The file system does not support xattrs')
+        copy_tree(self.src, self.dst)
+        executable = self.executable.replace(self.src, self.dst)
+        self.assertEqual(b'manager', os.getxattr(executable, 'user.brave'))
+    def test_destination_exists(self):
+        makedirs(self.dst)
+        with self.assertRaises(TreeError):
+            copy_tree(self.src, self.dst)
+        self.assertEqual([], listdir(self.dst))
+    def test_missing_source(self):
+        with self.assertRaises(FileNotFoundError):
+            copy_tree(join(self.src, 'missing'), self.dst)
+    def _check_copied(self):
+        executable = self.executable.replace(self.src, self.dst)
+        with open(executable, 'rb') as f:
+            self.assertEqual(b'binary' * 1000, f.read())
+        self.assertEqual(0o755, stat(executable).st_mode & 0o777)
+        link = join(self.dst, 'Contents', 'Frameworks', 'Current')
+        self.assertTrue(islink(link))
+        self.assertEqual('Versions/A', readlink(link))
+        with open(join(link, '9')) as f:
+            self.assertEqual('9', f.read())
@@ -0,0 +1,47 @@
+from os.path import dirname
+from subprocess import run
+from unittest import TestCase
+
+import re
+import sys
+
+# These take the bulk of the time it would take to import main.py. So they
+# must only be imported once they are needed.
+_HEAVY_MODULES = (
+    'requests', 'urllib3', 'questionary', 'prompt_toolkit', 'tqdm'
+)
+
+# Importing main.py took about 45ms on a typical machine without the modules
+# above, and over 170ms with them. This leaves room for slower machines, yet
+# fails if a heavy module is imported again.
+_MAX_IMPORT_TIME_MS = 120
+
+_NUM_RUNS = 5
+
+class StartupTest(TestCase):
+    def test_heavy_modules_are_imported_lazily(self):
+        imported = _import_main()
+        for module in _HEAVY_MODULES:
+            self.assertNotIn(module, imported)
+    def test_import_time(self):
+        # Take the fastest run, as others may have been slowed down by
+        # something else running on the machine.
+        import_time_ms = min(
+            _import_main()['main'] for _ in range(_NUM_RUNS)
+        ) / 1000
+        self.assertLess(import_time_ms, _MAX_IMPORT_TIME_MS)
+
+def _import_main():
+    # Returns the cumulative import time of each module, in microseconds, as
+    # reported by python -X importtime.
+    cp = run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=dirname(dirname(__file__)), capture_output=True, text=True,
+        check=True
+    )
+    result = {}
+    for line in cp.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)', line)
+        if match:
+            result[match.group(3)] = int(match.group(1))
+    return result
@@ -6,11 +6,15 @@ It's run manually, and the output is committed to the repo.
 
 Usage:
     GITHUB_TOKEN=github_pat_... python update_historic_releases.py .../src/brave
+
+Pass --graphql to look up many tags per request via GitHub's GraphQL API.
+This needs far fewer requests than the default REST API.
 """
 
 from argparse import ArgumentParser
 from impl.util import extract_version
-from impl.releases import update_historic_releases
+from impl.releases import update_historic_releases, \
+    NUM_CONCURRENT_TAG_REQUESTS
 from subprocess import check_output
 from time import sleep
 from tqdm import tqdm
@@ -19,13 +23,15 @@ import os
 import sys
 
 def main():
-    brave_core_path, github_token, clear_existing = parse_args_and_env()
+    brave_core_path, github_token, clear_existing, num_workers, use_graphql = \
+        parse_args_and_env()
     tags = get_tags_most_recent_first(brave_core_path)
     version_tags = extract_version_tags(tags)
     version_tags_iter = tqdm(version_tags, desc='Fetching historic releases')
     try:
         for wait_time in update_historic_releases(
-            version_tags_iter, github_token, clear_existing
+            version_tags_iter, github_token, clear_existing, num_workers,
+            use_graphql
         ):
             for _ in tqdm(range(wait_time), desc='Waiting for rate limit'):
                 sleep(1)
@@ -36,12 +42,21 @@ def parse_args_and_env():
     parser = ArgumentParser()
     parser.add_argument('brave_core_path', type=str)
     parser.add_argument('--clear-existing', action='store_true')
+    parser.add_argument(
+        '--num-workers', type=int, default=NUM_CONCURRENT_TAG_REQUESTS,
+        help='How many releases to fetch in parallel'
+    )
+    parser.add_argument(
+        '--graphql', action='store_true',
+        help="Use GitHub's GraphQL API to fetch many releases per request"
+    )
     args = parser.parse_args()
     github_token = os.getenv('GITHUB_TOKEN')
     if not github_token:
         print('GITHUB_TOKEN is not set')
         sys.exit(1)
-    return args.brave_core_path, github_token, args.clear_existing
+    return args.brave_core_path, github_token, args.clear_existing, \
+        args.num_workers, args.graphql
 
 def get_tags_most_recent_first(brave_core_path):
     output = check_output(['git', 'tag', '-l'], cwd=brave_core_path, text=True)
@@ -1,8 +1,7 @@
 from argparse import ArgumentParser
 from glob import glob
 from os import remove
-from os.path import join, exists
-from shutil import rmtree
+from os.path import abspath, dirname, join, exists
 from subprocess import run
 from tempfile import gettempdir
 from winreg import OpenKey, HKEY_LOCAL_MACHINE, HKEY_CURRENT_USER, \
@@ -12,6 +11,11 @@ import ctypes
 import os
 import sys
 
+# Use the parallel tree remover of the macOS version. It is much faster than
+# shutil.rmtree(...) for the many files of Brave's installation and profiles.
+sys.path.append(join(dirname(dirname(abspath(__file__))), 'macos'))
+from impl.tree import remove_tree
+
 WINDOWS_UNINSTALL_KEY = \
     r'SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall'
 
@@ -108,7 +112,7 @@ def uninstall_brave(is_origin, is_user, channel):
     if exists(install_dir):
         was_installed = True
         check_admin(is_user, app_name)
-        rmtree(install_dir)
+        remove_tree(install_dir)
     try:
         app_guid = get_app_id(is_origin, channel)
     except KeyError:
@@ -143,7 +147,7 @@ def delete_user_data_dir(is_origin, channel):
     user_data_dir = \
         join(os.getenv('LOCALAPPDATA'), 'BraveSoftware', app_name, 'User Data')
     try:
-        rmtree(user_data_dir)
+        remove_tree(user_data_dir)
     except FileNotFoundError:
         return False
     return True
@@ -161,9 +165,9 @@ def delete_temp_files(is_user):
             pass
     for dir_path in glob(join(temp_dir, 'GUM*.tmp')):
         try:
-            rmtree(dir_path)
+            remove_tree(dir_path)
         except OSError:
-            # Maybe it's in use, or it is a file.
+            # Maybe some of its files are in use. The rest is still removed.
             pass
 
 def check_admin(is_user, app_name):